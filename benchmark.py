@@ -0,0 +1,228 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from cube import build_cube, correlate, rolling_mean, year_window
+from finalstatsassignment import (AGRICULTURAL_LAND, CHART_COUNTRIES, CO2,
+                                  ELECTRIC_POWER, FOREST_AREA, INDICATORS,
+                                  MORTALITY, read_worldbank_data)
+
+
+# Income groups assigned round-robin to the synthetic economies
+INCOME_GROUPS = ['High income', 'Upper middle income', 'Lower middle income',
+                 'Low income']
+
+# WDI codes of the indicators kept by read_worldbank_data, in the order of
+# INDICATORS
+INDICATOR_CODES = [AGRICULTURAL_LAND, CO2, FOREST_AREA, ELECTRIC_POWER,
+                   'SP.POP.GROW', 'SP.POP.TOTL', MORTALITY]
+
+# Names of the economies of CHART_COUNTRIES, as used by income_group_slices
+CHART_NAMES = ['China', 'Thailand', 'Iran, Islamic Rep.', 'Sudan']
+
+
+def write_synthetic_wdi(directory, economies=266, indicators=1400,
+                        first_year=1960, last_year=2022, missing=0.1,
+                        seed=0):
+    """
+    Write WDI-shaped climatedata.csv and incomedata.csv files filled with
+    random values. The indicators always include the ones kept by
+    read_worldbank_data under their WDI codes, and the first economies are
+    the ones of the charts, so the files run through every command of
+    finalstatsassignment. Each row ends with the empty column of the World
+    Bank downloads.
+
+    Args:
+      - directory (str): Directory the two files are written to
+      - economies (int): Number of economies
+      - indicators (int): Number of indicators per economy, at least the
+        number of INDICATORS
+      - first_year (int): First year column
+      - last_year (int): Last year column
+      - missing (float): Share of values left empty
+      - seed (int): Seed of the random generator
+
+    Returns:
+      - paths (tuple): Paths of the data file and of the income file
+    """
+    if indicators < len(INDICATORS):
+        raise ValueError('indicators must be at least {}, the number of '
+                         'indicators read_worldbank_data keeps'.format(
+                             len(INDICATORS)))
+
+    rng = np.random.default_rng(seed)
+    years = [str(year) for year in range(first_year, last_year + 1)]
+    country_codes = (CHART_COUNTRIES + ['C{:03d}'.format(i)
+                                        for i in range(economies)])[:economies]
+    country_names = (CHART_NAMES + ['Country {}'.format(i)
+                                    for i in range(economies)])[:economies]
+    synthetic = range(indicators - len(INDICATORS))
+    indicator_names = INDICATORS + ['Synthetic indicator {}'.format(i)
+                                    for i in synthetic]
+    indicator_codes = INDICATOR_CODES + ['SYN.{}'.format(i)
+                                         for i in synthetic]
+
+    values = rng.lognormal(3.0, 2.0, (economies * indicators, len(years)))
+    values[rng.random(values.shape) < missing] = np.nan
+
+    df = pd.DataFrame(values, columns=years)
+    df.insert(0, 'Country Name', np.repeat(country_names, indicators))
+    df.insert(1, 'Country Code', np.repeat(country_codes, indicators))
+    df.insert(2, 'Indicator Name', np.tile(indicator_names, economies))
+    df.insert(3, 'Indicator Code', np.tile(indicator_codes, economies))
+    df['Unnamed: {}'.format(len(df.columns))] = np.nan
+
+    data_path = os.path.join(directory, 'climatedata.csv')
+    income_path = os.path.join(directory, 'incomedata.csv')
+    df.to_csv(data_path, index=False)
+    pd.DataFrame({
+        'Country Code': country_codes,
+        'Region': 'Synthetic',
+        'IncomeGroup': [INCOME_GROUPS[i % len(INCOME_GROUPS)]
+                        for i in range(economies)]
+    }).to_csv(income_path, index=False)
+
+    return data_path, income_path
+
+
+def _measure(function, repeat):
+    """
+    Call a function repeat times and return its last result with the
+    wall-clock seconds of every call, then call it once more under
+    tracemalloc for the peak traced memory, so tracing does not slow down
+    the timed calls.
+    """
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        seconds.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        function()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return result, {'seconds': seconds, 'best': min(seconds),
+                    'median': float(np.median(seconds)), 'peak_bytes': peak}
+
+
+def _commit():
+    """
+    Return the git commit of the working tree, or None outside a checkout.
+    """
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmark(economies=266, indicators=1400, first_year=1960,
+                  last_year=2022, window=5, period=20, repeat=3,
+                  fill_value=None):
+    """
+    Time every stage of the analysis on synthetic data: the cold and warm
+    loads, packing the cube, slicing sliding periods, the moving averages
+    and the correlations.
+
+    Args:
+      - economies (int): Number of synthetic economies
+      - indicators (int): Number of synthetic indicators per economy
+      - first_year (int): First year column
+      - last_year (int): Last year column
+      - window (int): Number of years in the moving window
+      - period (int): Number of years in each sliding period
+      - repeat (int): Number of timed runs of every stage
+      - fill_value (float): Value of missing years passed to
+        read_worldbank_data, None by default like the command line, so
+        the cube stages see the missing values as NaN
+
+    Returns:
+      - results (dict): Parameters, environment and per-stage timings
+    """
+    stages = {}
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        write_synthetic_wdi(tmp, economies, indicators, first_year,
+                            last_year)
+        os.chdir(tmp)
+        try:
+            (df, _), stages['load'] = _measure(
+                lambda: read_worldbank_data('climatedata.csv',
+                                            cache_dir=None,
+                                            fill_value=fill_value), repeat)
+            read_worldbank_data('climatedata.csv', fill_value=fill_value)
+            _, stages['load_cached'] = _measure(
+                lambda: read_worldbank_data('climatedata.csv',
+                                            fill_value=fill_value), repeat)
+        finally:
+            os.chdir(cwd)
+
+    cube, stages['cube'] = _measure(lambda: build_cube(df), repeat)
+    periods, stages['slice'] = _measure(
+        lambda: [year_window(cube, start, start + period - 1)
+                 for start in range(first_year, last_year - period + 2)],
+        repeat)
+    averages, stages['rolling'] = _measure(
+        lambda: [rolling_mean(values, window) for values in periods],
+        repeat)
+    _, stages['correlation'] = _measure(lambda: correlate(averages), repeat)
+
+    return {
+        'commit': _commit(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'parameters': {'economies': economies, 'indicators': indicators,
+                       'first_year': first_year, 'last_year': last_year,
+                       'window': window, 'period': period,
+                       'repeat': repeat, 'fill_value': fill_value,
+                       'rows': len(df)},
+        'stages': stages
+    }
+
+
+def main():
+    """
+    Run the benchmark from the command line and write the results as JSON.
+    """
+    parser = argparse.ArgumentParser(
+        description='Benchmark the World Bank analysis pipeline')
+    parser.add_argument('--economies', type=int, default=266)
+    parser.add_argument('--indicators', type=int, default=1400)
+    parser.add_argument('--first-year', type=int, default=1960)
+    parser.add_argument('--last-year', type=int, default=2022)
+    parser.add_argument('--window', type=int, default=5)
+    parser.add_argument('--period', type=int, default=20)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--fill-value', type=float, default=None,
+                        help='fill missing years instead of keeping NaN')
+    parser.add_argument('--output', default='benchmark.json')
+    args = parser.parse_args()
+
+    results = run_benchmark(args.economies, args.indicators, args.first_year,
+                            args.last_year, args.window, args.period,
+                            args.repeat, args.fill_value)
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+
+    for name, stage in results['stages'].items():
+        print('{:<12} {:>9.4f}s  {:>12,} bytes'.format(
+            name, stage['best'], stage['peak_bytes']))
+
+
+if __name__ == '__main__':
+    main()
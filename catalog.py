@@ -0,0 +1,179 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+
+# Summary statistics of every series, in column order
+CATALOG_COLUMNS = ['count', 'mean', 'std', 'min', 'max', 'first_year',
+                   'last_year', 'missing_ratio', 'checksum']
+
+
+def _series_checksums(values):
+    """
+    Hash every row of a year-column frame, so changed series can be found
+    without keeping the old values.
+    """
+    return pd.util.hash_pandas_object(values, index=False).to_numpy()
+
+
+def build_catalog(df):
+    """
+    Compute the summary statistics of every series of a frame in one
+    vectorised pass over its year columns. Missing years are skipped; std
+    uses ddof=1 like pandas, so it is NaN for series with one valid year.
+
+    Args:
+      - df (pd.DataFrame): Frame indexed by Country Code and Indicator Code,
+        as returned by read_worldbank_data
+
+    Returns:
+      - catalog (pd.DataFrame): One row per series with the CATALOG_COLUMNS
+        columns. checksum is a hash of the series used by update_catalog
+    """
+    years = df.select_dtypes('number').columns
+    values = df[years].to_numpy(dtype='float64')
+    valid = ~np.isnan(values)
+    count = valid.sum(axis=1)
+    present = count > 0
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.where(valid, values, 0.0).sum(axis=1) / count
+        deviations = np.where(valid, values - mean[:, None], 0.0)
+        std = np.sqrt((deviations ** 2).sum(axis=1) / (count - 1))
+    std[count < 2] = np.nan
+
+    year_labels = np.asarray(years.astype(int))
+    first = year_labels[np.argmax(valid, axis=1)]
+    last = year_labels[len(years) - 1 - np.argmax(valid[:, ::-1], axis=1)]
+
+    catalog = pd.DataFrame({
+        'count': count,
+        'mean': mean,
+        'std': std,
+        'min': np.where(present, np.where(valid, values, np.inf).min(axis=1),
+                        np.nan),
+        'max': np.where(present, np.where(valid, values, -np.inf).max(axis=1),
+                        np.nan),
+        'first_year': pd.array(np.where(present, first, 0), dtype='Int16'),
+        'last_year': pd.array(np.where(present, last, 0), dtype='Int16'),
+        'missing_ratio': 1.0 - count / max(len(years), 1),
+        'checksum': _series_checksums(df[years])
+    }, index=df.index)
+    catalog.loc[~present, ['first_year', 'last_year']] = pd.NA
+
+    return catalog
+
+
+def update_catalog(catalog, df):
+    """
+    Bring a catalog up to date with a new version of the data. Only the
+    series that are new or whose values changed are summarised again;
+    series no longer in the data are dropped.
+
+    Args:
+      - catalog (pd.DataFrame): Catalog built by build_catalog
+      - df (pd.DataFrame): The new frame
+
+    Returns:
+      - catalog (pd.DataFrame): Catalog of the new frame, in its row order
+      - stats (dict): Number of recomputed and of removed series
+    """
+    years = df.select_dtypes('number').columns
+    checksums = _series_checksums(df[years])
+    old = catalog['checksum'].reindex(df.index, fill_value=0).to_numpy()
+    changed = ~df.index.isin(catalog.index) | (old != checksums)
+
+    kept = catalog.reindex(df.index[~changed])
+    updated = pd.concat([kept, build_catalog(df[changed])]).reindex(df.index)
+    stats = {'recomputed_series': int(changed.sum()),
+             'removed_series': int((~catalog.index.isin(df.index)).sum())}
+
+    return updated, stats
+
+
+def indicator_summary(catalog):
+    """
+    Pool the series statistics of a catalog per indicator, without going
+    back to the data.
+
+    Args:
+      - catalog (pd.DataFrame): Catalog built by build_catalog
+
+    Returns:
+      - summary (pd.DataFrame): Count, mean, std, min, max and missing
+        ratio of every indicator over all countries
+    """
+    stats = catalog.assign(
+        total=catalog['count'] * catalog['mean'].fillna(0.0),
+        squares=((catalog['count'] - 1).clip(lower=0) *
+                 catalog['std'].fillna(0.0) ** 2 +
+                 catalog['count'] * catalog['mean'].fillna(0.0) ** 2))
+    grouped = stats.groupby(level='Indicator Code', observed=True)
+    count = grouped['count'].sum()
+    mean = grouped['total'].sum() / count
+    variance = ((grouped['squares'].sum() - count * mean ** 2) /
+                (count - 1)).clip(lower=0.0)
+
+    return pd.DataFrame({
+        'count': count,
+        'mean': mean,
+        'std': np.sqrt(variance.where(count > 1)),
+        'min': grouped['min'].min(),
+        'max': grouped['max'].max(),
+        'missing_ratio': grouped['missing_ratio'].mean()
+    })
+
+
+def save_catalog(catalog, stem):
+    """
+    Write a catalog to stem + '.parquet', or to stem + '.pkl' when no
+    Parquet engine is installed. The file is published like the cache
+    entries of the loader, through a unique temporary file, so concurrent
+    runs never see a truncated catalog or each other's temporary files.
+    """
+    from finalstatsassignment import _publish
+
+    directory = os.path.dirname(stem)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    try:
+        _publish(stem + '.parquet', catalog.to_parquet)
+    except ImportError:
+        _publish(stem + '.pkl', catalog.to_pickle)
+
+
+def load_catalog(stem):
+    """
+    Load a catalog written by save_catalog. Returns None if there is none.
+    """
+    if os.path.exists(stem + '.parquet'):
+        return pd.read_parquet(stem + '.parquet')
+    if os.path.exists(stem + '.pkl'):
+        return pd.read_pickle(stem + '.pkl')
+    return None
+
+
+def cached_catalog(df, stem):
+    """
+    Return the catalog of a frame, persisted under stem. A saved catalog
+    is updated with update_catalog and only written back if a series
+    changed; without one the catalog is built from scratch.
+
+    Args:
+      - df (pd.DataFrame): Frame returned by read_worldbank_data
+      - stem (str): Path of the catalog file, without extension
+
+    Returns:
+      - catalog (pd.DataFrame): The catalog of df
+    """
+    catalog = load_catalog(stem)
+    if catalog is None:
+        catalog = build_catalog(df)
+    else:
+        catalog, stats = update_catalog(catalog, df)
+        if not stats['recomputed_series'] and not stats['removed_series']:
+            return catalog
+    save_catalog(catalog, stem)
+
+    return catalog
@@ -0,0 +1,339 @@
+import collections
+
+import numpy as np
+import pandas as pd
+
+
+# Values of a country x indicator x year block with the labels of each axis
+Cube = collections.namedtuple('Cube', ['values', 'countries', 'indicators',
+                                       'years'])
+
+
+def build_cube(df, countries=None, indicators=None, years=None):
+    """
+    Pack the series of a frame indexed by Country Code and Indicator Code
+    into a 3-D float64 array of shape country x indicator x year. Pairs
+    that have no row in the frame are filled with NaN.
+
+    Args:
+      - df (pd.DataFrame): Frame returned by read_worldbank_data
+      - countries (list): Country codes, defaults to all in the frame
+      - indicators (list): Indicator codes, defaults to all in the frame
+      - years (list): Year columns, defaults to all numeric columns
+
+    Returns:
+      - cube (Cube): The values and the labels of each axis
+    """
+    if countries is None:
+        countries = df.index.get_level_values(0).unique().tolist()
+    if indicators is None:
+        indicators = df.index.get_level_values(1).unique().tolist()
+    if years is None:
+        years = df.select_dtypes('number').columns.tolist()
+
+    # Position of every row on the country and indicator axes
+    country_pos = pd.Index(countries).get_indexer(
+        df.index.get_level_values(0))
+    indicator_pos = pd.Index(indicators).get_indexer(
+        df.index.get_level_values(1))
+    keep = (country_pos >= 0) & (indicator_pos >= 0)
+
+    values = np.full((len(countries), len(indicators), len(years)), np.nan)
+    values[country_pos[keep], indicator_pos[keep]] = (
+        df[years].to_numpy(dtype='float64')[keep])
+
+    return Cube(values, list(countries), list(indicators), list(years))
+
+
+def align_cube(cube, countries, indicators, years):
+    """
+    Reindex a cube onto new labels, e.g. those of a newer release with
+    added years or economies. Labels missing from the cube are NaN.
+
+    Args:
+      - cube (Cube): Cube built by build_cube
+      - countries (list): Country codes of the result
+      - indicators (list): Indicator codes of the result
+      - years (list): Year columns of the result
+
+    Returns:
+      - aligned (Cube): Cube with the requested labels
+    """
+    labels = [countries, indicators, years]
+    source = [pd.Index(old).get_indexer(new) for old, new in
+              zip([cube.countries, cube.indicators, cube.years], labels)]
+    target = [np.flatnonzero(positions >= 0) for positions in source]
+
+    values = np.full(tuple(len(axis) for axis in labels), np.nan)
+    values[np.ix_(*target)] = cube.values[np.ix_(
+        *[positions[kept] for positions, kept in zip(source, target)])]
+
+    return Cube(values, list(countries), list(indicators), list(years))
+
+
+def year_window(cube, start, end, step=1):
+    """
+    Select the years start to end (inclusive) of a cube, taking every
+    step-th year. The values are a NumPy view on the cube's year axis, so
+    no data is copied however many windows are taken. The window is
+    sliced by position, so a cube whose years are not increasing raises
+    ValueError.
+
+    Args:
+      - cube (Cube): Cube built by build_cube
+      - start (int): First year of the window
+      - end (int): Last year of the window
+      - step (int): Distance between the selected years
+
+    Returns:
+      - window (Cube): Cube sharing its values with the input cube
+    """
+    numbers = [int(year) for year in cube.years]
+    if any(later <= earlier for earlier, later in zip(numbers, numbers[1:])):
+        raise ValueError('the years of the cube are not increasing')
+    positions = {year: p for p, year in enumerate(numbers)}
+    if start not in positions or end not in positions:
+        raise KeyError('years {}-{} are not all in the cube'.format(start,
+                                                                   end))
+    years = slice(positions[start], positions[end] + 1, step)
+
+    return cube._replace(values=cube.values[..., years],
+                         years=cube.years[years])
+
+
+def year_windows(cube, length, step=1, start=None, end=None):
+    """
+    Slide a window of length years over a cube, e.g. length=10 and step=1
+    for every decade. Each window is a view like the ones of year_window.
+
+    Args:
+      - cube (Cube): Cube built by build_cube
+      - length (int): Number of years in each window
+      - step (int): Number of years between the starts of two windows
+      - start (int): First year of the first window, defaults to the first
+        year of the cube
+      - end (int): Last year any window may reach, defaults to the last year
+        of the cube
+
+    Returns:
+      - windows (list): Cubes sharing their values with the input cube
+    """
+    if start is None:
+        start = int(cube.years[0])
+    if end is None:
+        end = int(cube.years[-1])
+
+    return [year_window(cube, first, first + length - 1)
+            for first in range(start, end - length + 2, step)]
+
+
+def moving_average(values, window=5, min_periods=None):
+    """
+    Compute the moving average of an array along its last axis with a
+    single cumulative-sum pass. NaNs are treated as missing rather than
+    filled: like pandas rolling().mean(), each average uses the valid
+    values of its window and is NaN when fewer than min_periods of them
+    are valid.
+
+    Args:
+      - values (np.ndarray): Series on the last axis
+      - window (int): Number of positions in the moving window
+      - min_periods (int): Valid values needed for an average, defaults to
+        window so any missing value in the window gives NaN
+
+    Returns:
+      - averages (np.ndarray): Array of the same shape as values
+    """
+    if min_periods is None:
+        min_periods = window
+    valid = ~np.isnan(values)
+    pad = np.zeros(values.shape[:-1] + (1,))
+
+    sums = np.cumsum(np.concatenate([pad, np.where(valid, values, 0.0)],
+                                    axis=-1), axis=-1)
+    counts = np.cumsum(np.concatenate([pad, valid], axis=-1), axis=-1)
+
+    # Window ending at position t covers positions max(t - window + 1, 0)
+    # to t, which are sums[t + 1] - sums[first] in the padded cumsum
+    first = np.maximum(np.arange(values.shape[-1]) + 1 - window, 0)
+    window_sums = sums[..., 1:] - sums[..., first]
+    window_counts = counts[..., 1:] - counts[..., first]
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(window_counts >= max(min_periods, 1),
+                        window_sums / window_counts, np.nan)
+
+
+def rolling_mean(cube, window=5, min_periods=None):
+    """
+    Compute the moving average of every series in a cube along the year
+    axis, see moving_average.
+
+    Args:
+      - cube (Cube): Cube built by build_cube
+      - window (int): Number of years in the moving window
+      - min_periods (int): Valid years needed for an average, defaults to
+        window
+
+    Returns:
+      - cube_ma (Cube): Cube of moving averages with the same labels
+    """
+    return cube._replace(values=moving_average(cube.values, window,
+                                               min_periods))
+
+
+def cube_to_frame(cube, long=False):
+    """
+    Turn a cube back into a frame indexed by Country Code and Indicator
+    Code, so it can be used with get_series.
+
+    Args:
+      - cube (Cube): Cube built by build_cube or rolling_mean
+      - long (bool): Return one row per (country, indicator, year) instead
+        of one column per year
+
+    Returns:
+      - frame (pd.DataFrame): Wide frame with year columns, or long frame
+        with a Value column when long is True
+    """
+    if long:
+        index = pd.MultiIndex.from_product(
+            [cube.countries, cube.indicators, cube.years],
+            names=['Country Code', 'Indicator Code', 'Year'])
+        return pd.DataFrame({'Value': cube.values.ravel()}, index=index)
+
+    index = pd.MultiIndex.from_product([cube.countries, cube.indicators],
+                                       names=['Country Code',
+                                              'Indicator Code'])
+
+    return pd.DataFrame(cube.values.reshape(-1, len(cube.years)),
+                        index=index, columns=cube.years)
+
+
+def _masked_pearson(x, y, mask, min_periods=2):
+    """
+    Pearson correlation along the last axis using only the positions where
+    mask is set. Gives NaN for fewer than min_periods points or a constant
+    series.
+    """
+    with np.errstate(invalid='ignore', divide='ignore'):
+        n = mask.sum(axis=-1)
+        dx = np.where(mask, x - (np.where(mask, x, 0.0).sum(axis=-1) /
+                                 n)[..., None], 0.0)
+        dy = np.where(mask, y - (np.where(mask, y, 0.0).sum(axis=-1) /
+                                 n)[..., None], 0.0)
+        r = (dx * dy).sum(axis=-1) / np.sqrt((dx * dx).sum(axis=-1) *
+                                             (dy * dy).sum(axis=-1))
+
+    return np.where(n >= min_periods, np.clip(r, -1.0, 1.0), np.nan)
+
+
+def _pearson_matrix(values, min_periods=2):
+    """
+    Pearson correlation between every pair of series on the second to last
+    axis, each pair using the years where both series are valid, built
+    from masked matrix products.
+    """
+    valid = ~np.isnan(values)
+    mask = valid.astype('float64')
+
+    # Centre every series first to keep the sums of squares well scaled
+    counts = np.maximum(mask.sum(axis=-1, keepdims=True), 1.0)
+    centred = np.where(valid, values, 0.0)
+    centred = np.where(valid, centred - centred.sum(axis=-1,
+                                                    keepdims=True) / counts,
+                       0.0)
+
+    mask_t = np.swapaxes(mask, -1, -2)
+    n = mask @ mask_t
+    sum_x = centred @ mask_t
+    sum_xx = (centred * centred) @ mask_t
+    sum_xy = centred @ np.swapaxes(centred, -1, -2)
+    sum_y = np.swapaxes(sum_x, -1, -2)
+    sum_yy = np.swapaxes(sum_xx, -1, -2)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        cov = sum_xy - sum_x * sum_y / n
+        var_x = sum_xx - sum_x * sum_x / n
+        var_y = sum_yy - sum_y * sum_y / n
+        r = cov / np.sqrt(var_x * var_y)
+
+    return np.where((n >= min_periods) & (var_x > 0) & (var_y > 0),
+                    np.clip(r, -1.0, 1.0), np.nan)
+
+
+def _spearman_matrix(values, min_periods=2):
+    """
+    Spearman correlation between every pair of series on the second to
+    last axis. Each series is ranked, with average ranks for ties, over
+    the years where both series of the pair are valid.
+    """
+    valid = ~np.isnan(values)
+    mask = valid.astype('float64')
+
+    # below[..., i, k, l] and equal[..., i, k, l] compare year l of series i
+    # with year k of the same series, counting only years where i is valid
+    below = ((values[..., None, :] < values[..., :, None]) &
+             valid[..., None, :]).astype('float64')
+    equal = ((values[..., None, :] == values[..., :, None]) &
+             valid[..., None, :]).astype('float64')
+
+    # ranks[..., i, j, k] is the rank of year k of series i among the years
+    # where both i and j are valid
+    ranks = (np.einsum('...ikl,...jl->...ijk', below, mask) +
+             (np.einsum('...ikl,...jl->...ijk', equal, mask) + 1.0) / 2.0)
+    pair_mask = valid[..., :, None, :] & valid[..., None, :, :]
+
+    return _masked_pearson(ranks, np.swapaxes(ranks, -2, -3), pair_mask,
+                           min_periods)
+
+
+def correlate(cubes, method='pearson', min_periods=2):
+    """
+    Correlate every pair of indicators for every country and every cube in
+    one vectorised pass. Missing years are masked pairwise, like
+    pd.Series.corr.
+
+    Args:
+      - cubes (list): Cubes with the same countries and indicators, e.g. the
+        moving averages of several year windows
+      - method (str): 'pearson' or 'spearman'
+      - min_periods (int): Years both series must be valid in for their
+        correlation not to be NaN, at least 2
+
+    Returns:
+      - correlations (np.ndarray): Array of shape country x window x
+        indicator x indicator
+    """
+    if method == 'pearson':
+        matrix = _pearson_matrix
+    elif method == 'spearman':
+        matrix = _spearman_matrix
+    else:
+        raise ValueError("method must be 'pearson' or 'spearman'")
+
+    min_periods = max(min_periods, 2)
+
+    return np.stack([matrix(cube.values, min_periods) for cube in cubes],
+                    axis=1)
+
+
+def correlation_frame(correlations, cube, windows):
+    """
+    Label a correlation array returned by correlate.
+
+    Args:
+      - correlations (np.ndarray): Array returned by correlate
+      - cube (Cube): One of the cubes passed to correlate
+      - windows (list): Name of each cube passed to correlate
+
+    Returns:
+      - correlations (pd.Series): Correlations indexed by Country Code,
+        Window and the two Indicator Codes
+    """
+    index = pd.MultiIndex.from_product(
+        [cube.countries, windows, cube.indicators, cube.indicators],
+        names=['Country Code', 'Window', 'Indicator Code',
+               'Other Indicator Code'])
+
+    return pd.Series(correlations.ravel(), index=index, name='Correlation')
@@ -0,0 +1,159 @@
+import collections
+
+import numpy as np
+
+from regression import Stats, fit, regress, sufficient_stats
+
+
+# Point diagnostics of a batch of simple linear regressions, each with the
+# shape of the data: leverage is the hat value h, residuals are the raw
+# residuals e, standardised residuals are e / sqrt(mse (1 - h)),
+# studentised residuals are the externally studentised ones and cooks is
+# Cook's distance. Points left out of the fit are NaN
+Diagnostics = collections.namedtuple('Diagnostics', ['leverage', 'residuals',
+                                                     'standardised',
+                                                     'studentised', 'cooks'])
+
+
+def diagnose(x, y, fits=None):
+    """
+    Compute the hat values, residuals and Cook's distances of a batch of
+    regressions of y on x along the last axis, with the closed-form
+    simple linear regression formulas. Points where x or y is NaN are left
+    out.
+
+    Args:
+      - x (np.ndarray): Predictor values, broadcastable with y
+      - y (np.ndarray): Response values
+      - fits (Fit): The fits of these points, computed if not given
+
+    Returns:
+      - diagnostics (Diagnostics): Point diagnostics with the data shape
+    """
+    x, y = np.broadcast_arrays(np.asarray(x, dtype='float64'),
+                               np.asarray(y, dtype='float64'))
+    if fits is None:
+        fits = regress(x, y)
+    valid = ~np.isnan(x) & ~np.isnan(y)
+    stats = fits.stats
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        n = np.asarray(stats.n, dtype='float64')[..., None]
+        df = fits.df[..., None]
+        leverage = 1.0 / n + ((x - stats.mean_x[..., None]) ** 2 /
+                              stats.sxx[..., None])
+        residuals = y - (fits.intercept[..., None] +
+                         fits.slope[..., None] * x)
+        standardised = residuals / np.sqrt(fits.mse[..., None] *
+                                           (1.0 - leverage))
+        studentised = standardised * np.sqrt(
+            (df - 1.0) / (df - standardised ** 2))
+        cooks = standardised ** 2 * leverage / (2.0 * (1.0 - leverage))
+
+    return Diagnostics(*(np.where(valid, values, np.nan)
+                         for values in (leverage, residuals, standardised,
+                                        studentised, cooks)))
+
+
+def downdate(stats, x, y, drop=True):
+    """
+    Remove one point from the sufficient statistics of a batch of
+    regressions without going back to the other points.
+
+    Args:
+      - stats (Stats): Statistics from sufficient_stats
+      - x (np.ndarray): Predictor value of the removed point, with the
+        batch shape of stats
+      - y (np.ndarray): Its response value
+      - drop (np.ndarray): Whether each regression loses its point; the
+        others are returned unchanged
+
+    Returns:
+      - stats (Stats): Statistics without the points
+    """
+    n = np.asarray(stats.n, dtype='float64')
+    drop = drop & (n > 1)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        dx = np.where(drop, x - stats.mean_x, 0.0)
+        dy = np.where(drop, y - stats.mean_y, 0.0)
+        scale = np.where(drop, n / (n - 1.0), 0.0)
+        rest = np.where(drop, n - 1.0, 1.0)
+
+    return Stats(stats.n - drop, stats.mean_x - dx / rest,
+                 stats.mean_y - dy / rest, stats.sxx - scale * dx * dx,
+                 stats.sxy - scale * dx * dy, stats.syy - scale * dy * dy)
+
+
+def prune(x, y, cooks_threshold=None, leverage_threshold=None,
+          residual_threshold=2.0, max_iter=1, min_points=3):
+    """
+    Drop outliers and bad leverage points from a batch of regressions one
+    at a time and refit. A point is flagged when its Cook's distance is
+    above cooks_threshold, or when its hat value is above
+    leverage_threshold and its standardised residual is above
+    residual_threshold in absolute value. In every round each regression
+    loses its flagged point with the largest Cook's distance, and is
+    refitted by downdating its sufficient statistics. Pruning stops when
+    no point is flagged or after max_iter rounds.
+
+    A single round is the default. The default cut-offs are recomputed
+    from the remaining points every round and flag some point of most
+    regressions even on clean data, so pruning until nothing is flagged
+    would strip several points from short series such as the ~17 years
+    of a World Bank window, while one round still removes a gross
+    outlier.
+
+    Args:
+      - x (np.ndarray): Predictor values, broadcastable with y
+      - y (np.ndarray): Response values
+      - cooks_threshold (float): Cook's distance cut-off, defaults to
+        4 / (n - 2) of each regression
+      - leverage_threshold (float): Hat value cut-off, defaults to 4 / n
+      - residual_threshold (float): Standardised residual cut-off
+      - max_iter (int): Most points removed from one regression, or None
+        to prune until no point is flagged
+      - min_points (int): Regressions are not pruned below this many
+        points
+
+    Returns:
+      - fits (Fit): The fits of the points that are kept
+      - removed (np.ndarray): Boolean mask of the removed points, with the
+        data shape
+    """
+    x, y = np.broadcast_arrays(np.asarray(x, dtype='float64'),
+                               np.asarray(y, dtype='float64'))
+    stats = sufficient_stats(x, y)
+    removed = np.zeros(x.shape, dtype=bool)
+    positions = np.arange(x.shape[-1])
+    kept_x = x
+
+    if max_iter is None:
+        max_iter = x.shape[-1]
+    for _ in range(max_iter):
+        fits = fit(stats)
+        diagnostics = diagnose(kept_x, y, fits)
+
+        n = np.asarray(stats.n, dtype='float64')[..., None]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            cooks_cut = (4.0 / (n - 2.0) if cooks_threshold is None
+                         else cooks_threshold)
+            leverage_cut = (4.0 / n if leverage_threshold is None
+                            else leverage_threshold)
+        flagged = ((diagnostics.cooks > cooks_cut) |
+                   ((diagnostics.leverage > leverage_cut) &
+                    (np.abs(diagnostics.standardised) > residual_threshold)))
+        flagged &= n > min_points
+        drop = flagged.any(axis=-1)
+        if not drop.any():
+            break
+
+        worst = np.argmax(np.where(flagged, diagnostics.cooks, -np.inf),
+                          axis=-1)[..., None]
+        stats = downdate(stats,
+                         np.take_along_axis(x, worst, axis=-1)[..., 0],
+                         np.take_along_axis(y, worst, axis=-1)[..., 0], drop)
+        removed |= (positions == worst) & drop[..., None]
+        kept_x = np.where(removed, np.nan, x)
+
+    return fit(stats), removed
@@ -0,0 +1,148 @@
+import os
+import shutil
+import tempfile
+
+import pandas as pd
+
+from tidy import to_long
+
+
+# Columns every exported row has. Series rows leave Other Indicator Code
+# empty and correlation rows leave Year empty
+EXPORT_COLUMNS = ['Country Code', 'Indicator Code', 'Other Indicator Code',
+                  'Year', 'Value']
+
+# Partition keys of the export, in directory order
+PARTITION_COLUMNS = ['group', 'window', 'kind']
+
+# Empty file marking a directory written by export_slices, so only those
+# are ever replaced. Readers skip it like any name starting with '_'
+MARKER = '_EXPORT_SLICES'
+
+# Prefix of the directories a dataset is written to before it is swapped in
+TMP_PREFIX = '.tmp-'
+
+
+def _export_rows(data):
+    """
+    Turn a year-column frame or a correlation Series into rows with the
+    EXPORT_COLUMNS columns.
+    """
+    if isinstance(data, pd.Series):
+        rows = data.rename('Value').reset_index()
+        rows = rows.drop(columns=[column for column in rows.columns
+                                  if column not in EXPORT_COLUMNS])
+        rows['Year'] = pd.array([pd.NA] * len(rows), dtype='Int16')
+    else:
+        rows = to_long(data, dropna=False)
+        rows['Year'] = rows['Year'].astype('Int16')
+        rows['Other Indicator Code'] = None
+
+    for column in ['Country Code', 'Indicator Code', 'Other Indicator Code']:
+        rows[column] = rows[column].astype(object)
+
+    return rows[EXPORT_COLUMNS]
+
+
+def _replaceable(path):
+    """
+    Check that an existing path may be replaced by a new export: it must be
+    an empty directory or one written by export_slices.
+    """
+    return os.path.isdir(path) and (not os.listdir(path) or
+                                    os.path.isfile(os.path.join(path,
+                                                                MARKER)))
+
+
+def export_slices(path, slices, compression='snappy'):
+    """
+    Write many slices in one batched write: a Parquet dataset partitioned
+    by group, window and kind. Without pyarrow, everything goes into a
+    single compressed pickle at path + '.pkl.gz' instead.
+
+    Args:
+      - path (str): Directory of the dataset. An existing directory is
+        only replaced if it is empty or was written by export_slices,
+        otherwise FileExistsError is raised
+      - slices (dict): Slices keyed by (group, window, kind), e.g.
+        ('rich', 'recent', 'moving_average'). Frames are stored by year,
+        and Series returned by correlation_frame as correlations
+      - compression (str): Parquet codec such as 'snappy' or 'zstd', or
+        None to write uncompressed
+
+    Returns:
+      - path (str): The dataset directory or pickle file written
+    """
+    frames = []
+    for (group, window, kind), data in slices.items():
+        rows = _export_rows(data)
+        rows['group'] = group
+        rows['window'] = window
+        rows['kind'] = kind
+        frames.append(rows)
+    table = pd.concat(frames, ignore_index=True)
+
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        table.to_pickle(path + '.pkl.gz', compression='gzip')
+        return path + '.pkl.gz'
+
+    if os.path.lexists(path) and not _replaceable(path):
+        raise FileExistsError(
+            '{} exists and was not written by export_slices'.format(path))
+
+    # Write the dataset next to path and swap it in, so a failed write
+    # leaves the previous export in place
+    parent = os.path.dirname(os.path.abspath(path))
+    tmp = tempfile.mkdtemp(dir=parent, prefix=TMP_PREFIX)
+    try:
+        pq.write_to_dataset(pa.Table.from_pandas(table, preserve_index=False),
+                            tmp, partition_cols=PARTITION_COLUMNS,
+                            compression=compression)
+        open(os.path.join(tmp, MARKER), 'w').close()
+        if os.path.lexists(path):
+            old = tempfile.mkdtemp(dir=parent, prefix=TMP_PREFIX)
+            os.replace(path, old)
+            os.replace(tmp, path)
+            shutil.rmtree(old)
+        else:
+            os.replace(tmp, path)
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+
+    return path
+
+
+def read_slices(path, group=None, window=None, kind=None, as_arrow=False):
+    """
+    Read slices written by export_slices, optionally only some partitions.
+
+    Args:
+      - path (str): Directory passed to export_slices
+      - group (str): Only read this group
+      - window (str): Only read this window
+      - kind (str): Only read this kind, e.g. 'values' or 'correlation'
+      - as_arrow (bool): Return the memory-mapped pyarrow Table, whose
+        columns are read without copying, instead of a DataFrame
+
+    Returns:
+      - rows (pd.DataFrame or pyarrow.Table): The rows of the partitions
+    """
+    wanted = {'group': group, 'window': window, 'kind': kind}
+    if not os.path.isdir(path) and os.path.exists(path + '.pkl.gz'):
+        rows = pd.read_pickle(path + '.pkl.gz', compression='gzip')
+        for column, value in wanted.items():
+            if value is not None:
+                rows = rows[rows[column] == value]
+        return rows
+
+    import pyarrow.parquet as pq
+
+    filters = [(column, '=', value) for column, value in wanted.items()
+               if value is not None]
+    table = pq.read_table(path, filters=filters or None, memory_map=True)
+
+    return table if as_arrow else table.to_pandas()
@@ -1,504 +1,1243 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import tempfile
+
+import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
 
+from catalog import cached_catalog, indicator_summary
+from cube import (build_cube, correlate, correlation_frame, cube_to_frame,
+                  rolling_mean, year_window)
+from export import export_slices
+from profiling import enable, stage, write_trace
 
-def read_worldbank_data(filename):
+
+# Indicators kept by read_worldbank_data
+INDICATORS = [
+    'Agricultural land (% of land area)',
+    'CO2 emissions (kt)',
+    'Forest area (sq. km)',
+    'Electric power consumption (kWh per capita)',
+    'Population growth (annual %)',
+    'Population, total',
+    'Mortality rate, under-5 (per 1,000 live births)'
+]
+
+# File holding the income group of every country
+INCOME_FILENAME = 'incomedata.csv'
+
+# Income table loaded by load_income_groups, by file path, size and mtime
+_income_groups = {}
+
+# Directory where the filtered and merged frames are cached
+CACHE_DIR = '.wbcache'
+
+# Environment variable naming the file a Chrome trace of main() is written
+# to, and the one switching on memory tracing in that trace
+TRACE_ENV = 'WB_TRACE'
+TRACE_MEMORY_ENV = 'WB_TRACE_MEMORY'
+
+# World Bank file analysed by main()
+DATA_FILENAME = 'climatedata.csv'
+
+# Year range the income group slices and moving averages are taken from
+START_YEAR = 1980
+END_YEAR = 2022
+
+# Number of years in the moving averages of main()
+MA_WINDOW = 5
+
+# Indicator codes used in the plots and correlations
+MORTALITY = 'SH.DYN.MORT'
+CO2 = 'EN.ATM.CO2E.KT'
+ELECTRIC_POWER = 'EG.USE.ELEC.KH.PC'
+FOREST_AREA = 'AG.LND.FRST.K2'
+AGRICULTURAL_LAND = 'AG.LND.AGRI.ZS'
+
+# Country codes of the China, Thailand, Iran and Sudan chart series
+CHART_COUNTRIES = ['CHN', 'THA', 'IRN', 'SDN']
+
+# Partitioned dataset main() exports every slice, moving average and
+# correlation to
+EXPORT_PATH = 'worldbank_slices'
+
+# Number of CSV rows parsed at a time by the streaming reader
+CHUNK_SIZE = 10000
+
+# Identifier columns, stored as categoricals once the rows are filtered
+ID_COLUMNS = ['Country Name', 'Country Code', 'Indicator Name',
+              'Indicator Code', 'IncomeGroup']
+
+# Levels of the sorted index of the frames returned by read_worldbank_data
+INDEX_COLUMNS = ['Country Code', 'Indicator Code']
+
+# Bumped whenever the layout of the cached frame changes
+CACHE_VERSION = 2
+
+# Prefix of the temporary files written in CACHE_DIR. It never matches the
+# prefix of a cache entry, so stale-entry cleanup does not touch them
+TMP_PREFIX = '.tmp-'
+
+# Dtype of the year columns
+VALUE_DTYPE = 'float32'
+
+
+def file_fingerprint(filename, block_size=1 << 16):
+    """
+    Fingerprint a source file by its size, modification time and a digest
+    of its first and last blocks, without reading the whole file.
+
+    Args:
+      - filename (str): The file to fingerprint
+      - block_size (int): Number of bytes hashed at each end of the file
+
+    Returns:
+      - fingerprint (dict): Size, mtime in nanoseconds and SHA-1 digest
+    """
+    stat = os.stat(filename)
+    digest = hashlib.sha1()
+    with open(filename, 'rb') as f:
+        digest.update(f.read(block_size))
+        if stat.st_size > block_size:
+            f.seek(max(stat.st_size - block_size, block_size))
+            digest.update(f.read(block_size))
+
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+            'sha1': digest.hexdigest()}
+
+
+def _cache_paths(filename, cache_dir, **options):
+    """
+    Return the cache file stem for a source file and the filename prefix
+    shared by every cached version of it. The prefix is the file name and
+    a digest of its absolute path, so files of the same name in different
+    directories, e.g. one directory per release, keep their own entries.
+    The stem is the prefix, a digest of the file contents and a digest of
+    every loader option that changes the cached frame, so entries for
+    different options of the same data can be told apart from entries for
+    older data.
+    """
+    data = json.dumps({
+        'data': file_fingerprint(filename),
+        'version': CACHE_VERSION
+    }, sort_keys=True)
+    key = json.dumps(options, sort_keys=True)
+    source = os.path.abspath(filename)
+    prefix = '{}-{}-'.format(os.path.basename(filename),
+                             hashlib.sha1(source.encode()).hexdigest()[:16])
+    stem = '{}{}-{}'.format(prefix,
+                            hashlib.sha1(data.encode()).hexdigest()[:16],
+                            hashlib.sha1(key.encode()).hexdigest()[:16])
+
+    return os.path.join(cache_dir, stem), prefix
+
+
+def _entry_paths(filename, cache_dir, indicators, value_dtype, income,
+                 fill_value):
+    """
+    Return the cache file stem and prefix of the frame read_worldbank_data
+    loads from a file with these options.
+    """
+    return _cache_paths(filename, cache_dir, indicators=sorted(indicators),
+                        value_dtype=value_dtype,
+                        income=_income_fingerprint(income),
+                        fill_value=fill_value)
+
+
+def catalog_stem(filenames, cache_dir=CACHE_DIR):
+    """
+    Return the stem the catalog of the frame load_data returns for some
+    files is kept under. It extends the cache stem of the first file, so
+    every data source and version has its own catalog, and an outdated
+    catalog is deleted with the other stale entries of that file.
+
+    Args:
+      - filenames (list): The World Bank data files passed to load_data
+      - cache_dir (str): Cache directory
+
+    Returns:
+      - stem (str): Path of the catalog file, without extension
+    """
+    income = load_income_groups()
+    stems = [_entry_paths(filename, cache_dir, INDICATORS, VALUE_DTYPE,
+                          income, None)[0]
+             for filename in filenames]
+    if len(stems) == 1:
+        return stems[0] + '.catalog'
+
+    combined = hashlib.sha1('\n'.join(stems).encode()).hexdigest()[:16]
+
+    return '{}-{}.catalog'.format(stems[0], combined)
+
+
+def load_income_groups(filename=INCOME_FILENAME):
+    """
+    Load the income group of every country as a categorical Series indexed
+    by Country Code. The table is read once per process and reused until
+    the file changes on disk.
+
+    Args:
+      - filename (str): The CSV file with Country Code and IncomeGroup
+        columns
+
+    Returns:
+      - income (pd.Series): Categorical income group by Country Code
+    """
+    stat = os.stat(filename)
+    key = (os.path.abspath(filename), stat.st_size, stat.st_mtime_ns)
+    if key not in _income_groups:
+        df = pd.read_csv(filename, usecols=['Country Code', 'IncomeGroup'],
+                         dtype=str).drop_duplicates('Country Code')
+        _income_groups.clear()
+        _income_groups[key] = pd.Series(
+            pd.Categorical(df['IncomeGroup']),
+            index=pd.Index(df['Country Code']), name='IncomeGroup')
+
+    return _income_groups[key]
+
+
+def _income_table(income):
+    """
+    Turn an income table passed in by the caller into the form
+    load_income_groups returns: a categorical Series named IncomeGroup,
+    with one entry per Country Code (the first one is kept).
+    """
+    if isinstance(income, dict):
+        income = pd.Series(income, dtype='category')
+    elif not isinstance(income.dtype, pd.CategoricalDtype):
+        income = income.astype('category')
+
+    return income[~income.index.duplicated()].rename('IncomeGroup')
+
+
+def _income_fingerprint(income):
+    """
+    Digest of an income table, so the cache notices when a different
+    table is passed in.
+    """
+    hashes = pd.util.hash_pandas_object(income.astype(str)).to_numpy()
+
+    return hashlib.sha1(hashes.tobytes()).hexdigest()
+
+
+def _add_income_groups(df, income):
+    """
+    Add the IncomeGroup column to a frame whose Country Code column is
+    categorical. Each distinct country is looked up once in the hashed
+    index of the income table and the rows take their group by category
+    code, instead of a general merge. Unknown countries get NaN.
+    """
+    countries = df['Country Code'].cat
+    positions = income.index.get_indexer(countries.categories)
+    group_codes = np.where(positions >= 0,
+                           income.cat.codes.to_numpy()[positions], -1)
+    row_codes = countries.codes.to_numpy()
+    row_codes = np.where(row_codes >= 0, group_codes[row_codes], -1)
+    df['IncomeGroup'] = pd.Categorical.from_codes(row_codes,
+                                                  income.cat.categories)
+
+    return df
+
+
+def _read_cached_frame(stem):
+    """
+    Load a cached frame, preferring Parquet and falling back to pickle
+    when no Parquet engine is installed. Returns None on a cache miss.
+    """
+    if os.path.exists(stem + '.parquet'):
+        return pd.read_parquet(stem + '.parquet')
+    if os.path.exists(stem + '.pkl'):
+        return pd.read_pickle(stem + '.pkl')
+    return None
+
+
+def _publish(path, write):
+    """
+    Write a cache file under a temporary name unique to this process and
+    move it into place, so an interrupted run never leaves a truncated
+    file behind and concurrent writers never touch each other's files.
+    write is called with the temporary path.
+    """
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path) or '.',
+                               prefix=TMP_PREFIX)
+    os.close(fd)
+    try:
+        write(tmp)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def _write_cached_frame(df, stem, prefix):
+    """
+    Write a frame to the cache and delete stale versions of the same
+    source file.
+    """
+    cache_dir = os.path.dirname(stem)
+    os.makedirs(cache_dir, exist_ok=True)
+    try:
+        _publish(stem + '.parquet', df.to_parquet)
+    except ImportError:
+        _publish(stem + '.pkl', df.to_pickle)
+
+    _remove_stale_entries(stem, prefix)
+
+
+def _remove_stale_entries(stem, prefix):
+    """
+    Delete the cache files of older versions of the same source file,
+    i.e. entries with another data digest. Entries of the same data
+    loaded with other options are kept. Temporary files being written by
+    other processes are left alone, and files another process already
+    deleted are skipped.
+    """
+    cache_dir, current = os.path.split(stem)
+    data_prefix = current.rsplit('-', 1)[0] + '-'
+    for name in os.listdir(cache_dir):
+        if name.startswith(prefix) and not name.startswith(data_prefix):
+            try:
+                os.remove(os.path.join(cache_dir, name))
+            except FileNotFoundError:
+                pass
+
+
+def write_value_matrix(df, stem):
+    """
+    Write the year values of a frame returned by read_worldbank_data to
+    stem.npy and its row and column labels to stem.labels.json, so other
+    processes can share the values through open_value_matrix.
+
+    Args:
+      - df (pd.DataFrame): Frame returned by read_worldbank_data
+      - stem (str): Path of the two files without their extensions
+    """
+    years = df.columns[~df.columns.isin(ID_COLUMNS)]
+    labels = {'years': years.tolist()}
+    for name in INDEX_COLUMNS:
+        level = pd.Categorical(df.index.get_level_values(name))
+        labels[name] = {'categories': level.categories.tolist(),
+                        'codes': level.codes.tolist()}
+    for name in df.columns.intersection(ID_COLUMNS):
+        column = df[name].astype('category').cat
+        labels[name] = {'categories': column.categories.tolist(),
+                        'codes': column.codes.tolist()}
+
+    def save_values(path):
+        with open(path, 'wb') as f:
+            np.save(f, np.ascontiguousarray(df[years].to_numpy()))
+
+    def save_labels(path):
+        with open(path, 'w') as f:
+            json.dump(labels, f)
+
+    # Every process loading the same entry writes the same two files, so
+    # whichever copy is published last is as good as any other. The
+    # labels go last: once they exist, the values are complete too
+    _publish(stem + '.npy', save_values)
+    _publish(stem + '.labels.json', save_labels)
+
+
+def open_value_matrix(stem):
+    """
+    Open a value matrix written by write_value_matrix as a frame laid out
+    like the ones of read_worldbank_data. The year values stay a read-only
+    np.memmap of stem.npy, so every process opening it shares one
+    page-cache copy. Returns None when the files do not exist or do not
+    match yet, e.g. while another process is still publishing them.
+
+    Args:
+      - stem (str): Path of the two files without their extensions
+
+    Returns:
+      - df (pd.DataFrame): Frame whose year columns are memory-mapped
+    """
+    try:
+        with open(stem + '.labels.json') as f:
+            labels = json.load(f)
+        values = np.load(stem + '.npy', mmap_mode='r')
+    except (OSError, ValueError):
+        return None
+    if values.shape != (len(labels['Country Code']['codes']),
+                        len(labels['years'])):
+        return None
+
+    def categorical(name):
+        return pd.Categorical.from_codes(labels[name]['codes'],
+                                         labels[name]['categories'])
+
+    index = pd.MultiIndex.from_arrays(
+        [categorical(name) for name in INDEX_COLUMNS], names=INDEX_COLUMNS)
+    df = pd.DataFrame(values, index=index, columns=labels['years'],
+                      copy=False)
+
+    # Inserting the identifier columns leaves the memory-mapped block as is
+    for position, name in enumerate(['Country Name', 'Indicator Name']):
+        if name in labels:
+            df.insert(position, name, categorical(name))
+    if 'IncomeGroup' in labels:
+        df.insert(len(df.columns), 'IncomeGroup', categorical('IncomeGroup'))
+
+    return df
+
+
+def _csv_schema(filename, value_dtype=VALUE_DTYPE):
+    """
+    Build the usecols and dtype arguments for pd.read_csv from the header
+    of the World Bank CSV. The empty trailing column is never parsed, and
+    the year columns are read straight into value_dtype.
+
+    Args:
+      - filename (str): The filename of the CSV file containing the data
+      - value_dtype (str): Dtype of the year columns
+
+    Returns:
+      - usecols (list): Names of the columns to parse
+      - dtype (dict): Dtype of every parsed column
+    """
+    header = pd.read_csv(filename, nrows=0).columns
+    usecols = list(header[:-1])
+    dtype = {column: (str if column in ID_COLUMNS else value_dtype)
+             for column in usecols}
+
+    return usecols, dtype
+
+
+def _read_indicator_rows(filename, indicators, chunksize=CHUNK_SIZE,
+                         value_dtype=VALUE_DTYPE):
+    """
+    Stream the World Bank CSV in chunks and keep only the rows of the
+    requested indicators, so peak memory is bounded by the chunk size
+    rather than by the size of the file.
+
+    Args:
+      - filename (str): The filename of the CSV file containing the data
+      - indicators (list): Indicator names to keep
+      - chunksize (int): Number of CSV rows parsed per chunk
+      - value_dtype (str): Dtype of the year columns
+
+    Returns:
+      - df (pd.DataFrame): The matching rows, in file order
+    """
+    with stage('parse_csv') as record:
+        usecols, dtype = _csv_schema(filename, value_dtype)
+        chunks = []
+        rows_read = 0
+        for chunk in pd.read_csv(filename, usecols=usecols, dtype=dtype,
+                                 chunksize=chunksize):
+            rows_read += len(chunk)
+            chunks.append(chunk[chunk['Indicator Name'].isin(indicators)])
+        df = pd.concat(chunks, ignore_index=True)
+        record.update(rows_read=rows_read, rows=len(df),
+                      bytes=os.path.getsize(filename))
+
+    return df
+
+
+def _load_worldbank_frame(filename, indicators, income,
+                          chunksize=CHUNK_SIZE, value_dtype=VALUE_DTYPE,
+                          fill_value=0):
+    """
+    Parse the World Bank CSV, keep the requested indicators and add the
+    income group of every country.
+    """
+    # Read the rows of the wanted indicators from the CSV file
+    df_filtered = _read_indicator_rows(filename, indicators, chunksize,
+                                       value_dtype)
+
+    return _prepare_frame(df_filtered, income, fill_value)
+
+
+def _prepare_frame(df_filtered, income, fill_value=0):
+    """
+    Fill, categorise, add the income groups to and index the rows read by
+    _read_indicator_rows.
+    """
+    # Fill missing values, unless they are kept as NaN
+    if fill_value is not None:
+        with stage('fillna', rows=len(df_filtered)):
+            year_columns = df_filtered.columns.difference(ID_COLUMNS)
+            df_filtered[year_columns] = df_filtered[year_columns].fillna(
+                fill_value)
+
+    # Store the repeated identifier strings once per category
+    with stage('categorise', rows=len(df_filtered)):
+        columns = [column for column in ID_COLUMNS
+                   if column in df_filtered.columns]
+        df_filtered[columns] = df_filtered[columns].astype('category')
+
+    # Look up the income group of every country
+    with stage('income_lookup', rows=len(df_filtered)):
+        df_filtered = _add_income_groups(df_filtered, income)
+
+    # Index the series by country and indicator code for fast lookups
+    with stage('index', rows=len(df_filtered)) as record:
+        df_filtered = df_filtered.set_index(INDEX_COLUMNS).sort_index()
+        record['bytes'] = int(df_filtered.memory_usage().sum())
+
+    return df_filtered
+
+
+def read_worldbank_data(filename, indicators=None, cache_dir=CACHE_DIR,
+                        chunksize=CHUNK_SIZE, value_dtype=VALUE_DTYPE,
+                        income=None, fill_value=0, mmap=False):
     """
     Read the data in Worldbank format from a CSV file and return two 
     dataframes:
     one with years as columns and one with countries as columns.
 
+    The filtered and merged frame is cached in a columnar file under
+    cache_dir, keyed by the fingerprint of the data file, the income table
+    and the indicator list, so later runs skip the CSV parse. A cache entry
+    whose source files have changed is rebuilt automatically. On a cache
+    miss the CSV is streamed in chunks of chunksize rows and only the
+    rows of the wanted indicators are kept. Identifier columns are
+    returned as categoricals and year columns as value_dtype. df_filtered
+    is indexed by the sorted (Country Code, Indicator Code) pairs, see
+    get_series, and the columns of the transposed frame keep those codes
+    as their first two levels, followed by Country Name and IncomeGroup.
+    Income groups come from load_income_groups unless an
+    income table is passed in. Missing values are filled with fill_value;
+    pass None to keep them as NaN, which the moving averages and
+    correlations of the cube module treat as missing. With mmap, the year
+    values are also written once to a .npy file next to the cache entry
+    and opened read-only with np.memmap, see open_value_matrix.
+
     Args:
       - filename (str): The filename of the CSV file containing the data
+      - indicators (list): Indicator names to keep, defaults to INDICATORS
+      - cache_dir (str): Cache directory, or None to disable caching
+      - chunksize (int): Number of CSV rows parsed per chunk
+      - value_dtype (str): Dtype of the year columns, e.g. 'float64' when
+        float32 precision is not enough
+      - income (pd.Series or dict): Income group by Country Code, defaults
+        to load_income_groups()
+      - fill_value (float): Value of missing years, or None to keep NaN
+      - mmap (bool): Return year columns memory-mapped from a .npy file in
+        cache_dir, shared by every process that opens the same entry
 
     Returns:
-      - df_filtered (pd.DataFrame): DataFrame with filtered data
+      - df_filtered (pd.DataFrame): DataFrame with filtered data, indexed by
+        Country Code and Indicator Code
       - df_filtered_transposed (pd.DataFrame): DataFrame with filtered data 
-        transposed
-    """
-    # Read the data from the CSV file
-    df = pd.read_csv(filename)
-
-    # Fill missing values with 0
-    df = df.fillna(0)
-
-    # Drop unnecessary columns
-    df = df.drop(df.columns[[3, -1]], axis='columns')
-
-    # Filter the data by indicators
-    indicators = [
-        'Agricultural land (% of land area)',
-        'CO2 emissions (kt)',
-        'Forest area (sq. km)',
-        'Electric power consumption (kWh per capita)',
-        'Population growth (annual %)',
-        'Population, total',
-        'Mortality rate, under-5 (per 1,000 live births)'
-    ]
-    df_filtered = df[df['Indicator Name'].isin(indicators)]
-    df_filtered = df_filtered.reset_index(drop=True)
-
-    # Merge with the income data
-    df2 = pd.read_csv('incomedata.csv')
-    df_filtered = pd.merge(df_filtered, df2[['Country Code', 'IncomeGroup']],
-                           on='Country Code', how='left')
-
-    # Transpose the dataframe to get years as columns
-    df_filtered_transposed = df_filtered.set_index(
-        ['Country Name', 'IncomeGroup']).T
-
-    return df_filtered, df_filtered_transposed
-
-
-# Usage example:
-df_filtered, df_filtered_transposed = read_worldbank_data('climatedata.csv')
-print("Filtered dataframe:")
-print(df_filtered.head())
-print("\nTransposed dataframe:")
-print(df_filtered_transposed.head())
-
-# Using .describe() to explore the data
-print(df_filtered.describe())
-print(df_filtered_transposed.describe())
-
-# Defining countries by income
-rich_countries = ['China']
-lower_middle_income_countries = ['Iran, Islamic Rep.']
-upper_middle_income_countries = ['Thailand']
-poor_countries = ['Sudan']
-
-rich_countries = df_filtered[df_filtered['Country Name'].isin(rich_countries)]
-lower_middle_income_countries = df_filtered[df_filtered['Country Name'].isin(
-    lower_middle_income_countries)]
-upper_middle_income_countries = df_filtered[df_filtered['Country Name'].isin(
-    upper_middle_income_countries)]
-poor_countries = df_filtered[df_filtered['Country Name'].isin(poor_countries)]
-
-country_groups = {
-    'rich': ['China'],
-    'lower_middle': ['Iran, Islamic Rep.'],
-    'upper_middle': ['Thailand'],
-    'poor': ['Sudan']
-}
-
-# Iterate over each group
-for group_name, countries in country_groups.items():
-    # Filter the DataFrame for countries in the current group
-    group_data = df_filtered[df_filtered['Country Name'].isin(countries)]
-
-    # Group the filtered data by 'Country Name'
-    grouped_data = group_data.groupby('Country Name')
-
-    # Print the group name
-    print(group_name)
-
-    # Iterate over each country in the group
-    for country, country_data in grouped_data:
-        print(country)
-        print(country_data)
-
-# Define the start and end years
-start_year = 1980
-end_year = 2022
-
-# Define the list of columns to include in the dataframes
-columns_to_include = ['Country Name', 'Country Code', 'IncomeGroup',
-                      'Indicator Name']
-
-# Slice the dataframes for the most recent 20 years and the start 20 years
-recent_20_years_columns = [str(year) for year in range(end_year - 20,
-                                                       end_year + 1)]
-start_20_years_columns = [str(year) for year in range(start_year,
-                                                      start_year + 21)]
-
-rich_countries_recent_20_years = rich_countries[columns_to_include +
-                                                recent_20_years_columns]
-rich_countries_start_20_years = rich_countries[columns_to_include +
-                                               start_20_years_columns]
-
-lower_middle_income_recent_20_years = lower_middle_income_countries[
-    columns_to_include + recent_20_years_columns]
-lower_middle_income_start_20_years = lower_middle_income_countries[
-    columns_to_include + start_20_years_columns]
-
-upper_middle_income_recent_20_years = upper_middle_income_countries[
-    columns_to_include + recent_20_years_columns]
-upper_middle_income_start_20_years = upper_middle_income_countries[
-    columns_to_include + start_20_years_columns]
-
-poor_countries_recent_20_years = poor_countries[columns_to_include +
-                                                recent_20_years_columns]
-poor_countries_start_20_years = poor_countries[columns_to_include +
-                                               start_20_years_columns]
-
-print('poor country:')
-print(poor_countries_recent_20_years)
-print(poor_countries_start_20_years)
-rich_countries_recent_20_years.to_csv('test.csv')
-rich_countries_start_20_years.to_csv('richstart20.csv')
-lower_middle_income_recent_20_years.to_csv('lowrec20.csv')
-lower_middle_income_start_20_years.to_csv('lowstart20.csv')
-upper_middle_income_recent_20_years.to_csv('upprec20.csv')
-upper_middle_income_start_20_years.to_csv('uppstart20.csv')
-poor_countries_recent_20_years.to_csv('poorrec20.csv')
-poor_countries_start_20_years.to_csv('poorstart20.csv')
-
-# Calculate moving averages for the recent 20 years and start 20 years for rich countries
-rich_recent_20_years_ma = rich_countries_recent_20_years.rolling(window=5,
-                                                                  axis=1).mean()
-rich_start_20_years_ma = rich_countries_start_20_years.rolling(window=5,
-                                                                axis=1).mean()
-
-# Calculate moving averages for the recent 20 years and start 20 years for lower middle income countries
-lower_middle_income_recent_20_years_ma = lower_middle_income_recent_20_years.rolling(
-    window=5, axis=1).mean()
-lower_middle_income_start_20_years_ma = lower_middle_income_start_20_years.rolling(
-    window=5, axis=1).mean()
-
-# Calculate moving averages for the recent 20 years and start 20 years for upper middle income countries
-upper_middle_income_recent_20_years_ma = upper_middle_income_recent_20_years.rolling(
-    window=5, axis=1).mean()
-upper_middle_income_start_20_years_ma = upper_middle_income_start_20_years.rolling(
-    window=5, axis=1).mean()
-
-# Calculate moving averages for the recent 20 years and start 20 years for poor countries
-poor_countries_recent_20_years_ma = poor_countries_recent_20_years.rolling(
-    window=5, axis=1).mean()
-poor_countries_start_20_years_ma = poor_countries_start_20_years.rolling(
-    window=5, axis=1).mean()
-
-
-# Transposing
-rich_recent_20_years_ma_trans = rich_recent_20_years_ma.rename_axis('Year').T
-upper_middle_income_recent_20_years_ma_trans = upper_middle_income_recent_20_years_ma.rename_axis(
-    'Year').T
-lower_middle_income_recent_20_years_ma_trans = lower_middle_income_recent_20_years_ma.rename_axis(
-    'Year').T
-poor_recent_20_years_ma_trans = poor_countries_recent_20_years_ma.rename_axis(
-    'Year').T
-rich_start_20_years_ma_trans = rich_start_20_years_ma.rename_axis('Year').T
-upper_middle_income_start_20_years_ma_trans = upper_middle_income_start_20_years_ma.rename_axis(
-    'Year').T
-lower_middle_income_start_20_years_ma_trans = lower_middle_income_start_20_years_ma.rename_axis(
-    'Year').T
-poor_start_20_years_ma_trans = poor_countries_start_20_years_ma.rename_axis(
-    'Year').T
-
-# Defining variables
-years = rich_recent_20_years_ma_trans.index
-years2 = upper_middle_income_recent_20_years_ma_trans.index
-years3 = lower_middle_income_recent_20_years_ma_trans.index
-years4 = poor_recent_20_years_ma_trans.index
-years5 = rich_start_20_years_ma_trans.index
-years6 = upper_middle_income_start_20_years_ma_trans.index
-years7 = lower_middle_income_start_20_years_ma_trans.index
-years8 = poor_start_20_years_ma_trans.index
-
-# Plotting recent 20 years for CO2 emissions
-plt.figure(figsize=(10, 6))
-plt.plot(years, rich_recent_20_years_ma_trans[283], label='China')
-plt.plot(years2, upper_middle_income_recent_20_years_ma_trans[1634],
-         label='Thailand')
-plt.plot(years3, lower_middle_income_recent_20_years_ma_trans[787],
-         label='Iran')
-plt.plot(years4, poor_recent_20_years_ma_trans[1445], label='Sudan')
-
-plt.xlabel('Year')
-plt.ylabel('Value')
-plt.title('CO2 emissions (kt) Recent 20 Years Moving Averages')
-
-plt.legend()
-plt.grid(True)
-plt.savefig('CO2 emissions rec 20 years')
-plt.show()
-
-# Plotting recent 20 years for Electric Power Consumption
-plt.figure(figsize=(10, 6))
-plt.plot(years, rich_recent_20_years_ma_trans[284], label='China')
-plt.plot(years2, upper_middle_income_recent_20_years_ma_trans[1635],
-         label='Thailand')
-plt.plot(years3, lower_middle_income_recent_20_years_ma_trans[788],
-         label='Iran')
-plt.plot(years4, poor_recent_20_years_ma_trans[1445], label='Sudan')
-
-plt.xlabel('Year')
-plt.ylabel('Value')
-plt.title('Electric Power Consumption Recent 20 Years Moving Averages')
-
-plt.legend()
-plt.grid(True)
-plt.savefig('Electric Power Consumption Recent 20 years')
-plt.show()
-
-# Plotting start 20 years for CO2 emissions
-plt.figure(figsize=(10, 6))
-plt.plot(years5, rich_start_20_years_ma_trans[283], label='China')
-plt.plot(years6, upper_middle_income_start_20_years_ma_trans[1634],
-         label='Thailand')
-plt.plot(years7, lower_middle_income_start_20_years_ma_trans[787],
-         label='Iran')
-plt.plot(years8, poor_start_20_years_ma_trans[1445], label='Sudan')
-
-plt.xlabel('Year')
-plt.ylabel('Value')
-plt.title('CO2 emissions Start 20 Years Moving Averages')
-
-plt.legend()
-plt.grid(True)
-plt.savefig('CO2 emissions start 20 years')
-plt.show()
-
-# Plotting start 20 years for Electric Power Consumption
-plt.figure(figsize=(10, 6))
-plt.plot(years5, rich_start_20_years_ma_trans[284], label='China')
-plt.plot(years6, upper_middle_income_start_20_years_ma_trans[1635],
-         label='Thailand')
-plt.plot(years7, lower_middle_income_start_20_years_ma_trans[788],
-         label='Iran')
-plt.plot(years8, poor_start_20_years_ma_trans[1446], label='Sudan')
-
-plt.xlabel('Year')
-plt.ylabel('Value')
-plt.title('Electric Power Consumption Start 20 Years Moving Averages')
-
-plt.legend()
-plt.grid(True)
-plt.savefig('Electric power consumption Start 20 years')
-plt.show()
-
-# Plotting start 20 years for agricultural land
-plt.figure(figsize=(10, 6))
-plt.plot(years5, rich_start_20_years_ma_trans[286], label='China')
-plt.plot(years6, upper_middle_income_start_20_years_ma_trans[1637],
-         label='Thailand')
-plt.plot(years7, lower_middle_income_start_20_years_ma_trans[790],
-         label='Iran')
-plt.plot(years8, poor_start_20_years_ma_trans[1446], label='Sudan')
-
-plt.xlabel('Year')
-plt.ylabel('Value')
-plt.title('Agricultural Land Start 20 Years Moving Averages')
-
-plt.legend()
-plt.grid(True)
-plt.savefig('Agriclutural land start 20 years')
-plt.show()
-
-# Plotting recent 20 years for agricultural land
-plt.figure(figsize=(10, 6))
-plt.plot(years, rich_recent_20_years_ma_trans[286], label='China')
-plt.plot(years2, upper_middle_income_recent_20_years_ma_trans[1637],
-         label='Thailand')
-plt.plot(years3, lower_middle_income_recent_20_years_ma_trans[790],
-         label='Iran')
-plt.plot(years4, poor_recent_20_years_ma_trans[1446], label='Sudan')
-
-plt.xlabel('Year')
-plt.ylabel('Value')
-plt.title('Agricultural Land Recent 20 Years Moving Averages')
-
-plt.legend()
-plt.grid(True)
-plt.savefig('Agricultural land Recent 20 years')
-plt.show()
-
-# Plotting Start 20 years Forest Area
-plt.figure(figsize=(10, 6))
-plt.plot(years5, rich_start_20_years_ma_trans[285], label='China')
-plt.plot(years6, upper_middle_income_start_20_years_ma_trans[1636],
-         label='Thailand')
-plt.plot(years7, lower_middle_income_start_20_years_ma_trans[789],
-         label='Iran')
-plt.plot(years8, poor_start_20_years_ma_trans[1447], label='Sudan')
-
-plt.xlabel('Year')
-plt.ylabel('Value')
-plt.title('Forest Area Start 20 Years Moving Averages')
-
-plt.legend()
-plt.grid(True)
-plt.savefig('Forest Area start 20 years')
-plt.show()
-
-# Plotting Recent 20 years Forest Area
-plt.figure(figsize=(10, 6))
-plt.plot(years, rich_recent_20_years_ma_trans[285], label='China')
-plt.plot(years2, upper_middle_income_recent_20_years_ma_trans[1636],
-         label='Thailand')
-plt.plot(years3, lower_middle_income_recent_20_years_ma_trans[789],
-         label='Iran')
-plt.plot(years4, poor_recent_20_years_ma_trans[1447], label='Sudan')
-
-plt.xlabel('Year')
-plt.ylabel('Value')
-plt.title('Forest Area Recent 20 Years Moving Averages')
-
-plt.legend()
-plt.grid(True)
-plt.savefig('Forest Area recent 20 years')
-plt.show()
-
-print('------------------------CO2 AND FOREST AREA-------------------------')
-
-# Correlation for rich start 20 years Co2 and forest area
-corr_start_r = rich_start_20_years_ma_trans[283].corr(
-    rich_start_20_years_ma_trans[285])
-print(corr_start_r)
-
-# Correlation for rich recent 20 years Co2 and forest area
-corr_rec_r = rich_recent_20_years_ma_trans[283].corr(
-    rich_recent_20_years_ma_trans[285])
-print(corr_rec_r)
-
-# Correlation for upper start 20 years Co2 and forest area
-corr_start_u = upper_middle_income_start_20_years_ma_trans[1634].corr(
-    upper_middle_income_start_20_years_ma_trans[1636])
-print(corr_start_u)
-
-# Correlation for upper recent 20 years Co2 and forest area
-corr_rec_u = upper_middle_income_recent_20_years_ma_trans[1634].corr(
-    upper_middle_income_recent_20_years_ma_trans[1636])
-print(corr_rec_u)
-
-# Correlation for lower start 20 years Co2 and forest area
-corr_start_l = lower_middle_income_start_20_years_ma_trans[787].corr(
-    lower_middle_income_start_20_years_ma_trans[789])
-print(corr_start_l)
-
-# Correlation for lower recent 20 years Co2 and forest area
-corr_rec_l = lower_middle_income_recent_20_years_ma_trans[787].corr(
-    lower_middle_income_recent_20_years_ma_trans[789])
-print(corr_rec_l)
-
-# Correlation for poor start 20 years Co2 and forest area
-corr_start_p = poor_start_20_years_ma_trans[1445].corr(
-    poor_start_20_years_ma_trans[1447])
-print(corr_start_p)
-
-# Correlation for poor recent 20 years Co2 and forest area
-corr_rec_p = poor_recent_20_years_ma_trans[1445].corr(
-    poor_recent_20_years_ma_trans[1447])
-print(corr_rec_p)
-
-print('---------------------CO2 AND MORTALITY RATE-----------------------')
-
-# Correlation for rich start 20 years Co2 and Mortality rate
-corr_start_r_m = rich_start_20_years_ma_trans[283].corr(
-    rich_start_20_years_ma_trans[282])
-print(corr_start_r_m)
-
-# Correlation for rich reecent 20 year Co2 and mortality rate
-corr_rec_r_m = rich_recent_20_years_ma_trans[283].corr(
-    rich_recent_20_years_ma_trans[282])
-print(corr_rec_r_m)
-
-# Correlation for upper start 20 years Co2 and mortality rate
-corr_start_u_m = upper_middle_income_start_20_years_ma_trans[1634].corr(
-    upper_middle_income_start_20_years_ma_trans[1633])
-print(corr_start_u_m)
-
-
-# Correlation for upper recent 20 years Co2 and mortality rate
-corr_rec_u_m = upper_middle_income_recent_20_years_ma_trans[1634].corr(
-    upper_middle_income_recent_20_years_ma_trans[1633])
-print(corr_rec_u_m)
-
-# Correlation for lower start 20 years Co2 and mortality rate
-corr_start_l_m = lower_middle_income_start_20_years_ma_trans[787].corr(
-    lower_middle_income_start_20_years_ma_trans[786])
-print(corr_start_l_m)
-
-# Correlation for lower recent 20 years Co2 and mortality rate
-corr_rec_l_m = lower_middle_income_recent_20_years_ma_trans[787].corr(
-    lower_middle_income_recent_20_years_ma_trans[786])
-print(corr_rec_l_m)
-
-# Correlation for poor start 20 years Co2 and mortality rate
-corr_start_p_m = poor_start_20_years_ma_trans[1445].corr(
-    poor_start_20_years_ma_trans[1444])
-print(corr_start_p_m)
-
-# Correlation for lower rceent 20 years Co2 and mortality rate
-corr_rec_p_m = poor_recent_20_years_ma_trans[1445].corr(
-    poor_recent_20_years_ma_trans[1444])
-print(corr_rec_p_m)
-
-
-print('-----------------CO2 AMD ELECTRIC POWER CONSUMPTION-------------------')
-
-# Correlation for rich start 20 years Co2 and electric power
-corr_start_r_e = rich_start_20_years_ma_trans[283].corr(
-    rich_start_20_years_ma_trans[284])
-print(corr_start_r_e)
-
-# Correlation for rich recent 20 years Co2 and electric power
-corr_rec_r_e = rich_recent_20_years_ma_trans[283].corr(
-    rich_recent_20_years_ma_trans[284])
-print(corr_rec_r_e)
-
-# Correlation for upper start 20 years Co2 and electric power
-corr_start_u_e = upper_middle_income_start_20_years_ma_trans[1634].corr(
-    upper_middle_income_start_20_years_ma_trans[1635])
-print(corr_start_u_e)
-
-
-# Correlation for upper recent 20 years Co2 and electric power
-corr_rec_u_e = upper_middle_income_recent_20_years_ma_trans[1634].corr(
-    upper_middle_income_recent_20_years_ma_trans[1635])
-print(corr_rec_u_e)
-
-# Correlation for lower start 20 years Co2 and electric power
-corr_start_l_e = lower_middle_income_start_20_years_ma_trans[787].corr(
-    lower_middle_income_start_20_years_ma_trans[788])
-print(corr_start_l_e)
-
-# Correlation for lower recent 20 years Co2 and electric power
-corr_rec_l_e = lower_middle_income_recent_20_years_ma_trans[787].corr(
-    lower_middle_income_recent_20_years_ma_trans[788])
-print(corr_rec_l_e)
-
-# Correlation for poor start 20 years Co2 and electric power
-corr_start_p_e = poor_start_20_years_ma_trans[1445].corr(
-    poor_start_20_years_ma_trans[1446])
-print(corr_start_p_e)
-
-# Correlation for poor recemt 20 years Co2 and electric power
-corr_rec_p_e = poor_recent_20_years_ma_trans[1445].corr(
-    poor_recent_20_years_ma_trans[1446])
-print(corr_rec_p_e)
-
-
-# Plotting start 20 years for  all indicators and income groups
-x = ['China', 'Thailand', 'Iran', 'Sudan']
-plt.figure(figsize=(10, 6))
-plt.scatter(x, [corr_start_r, corr_start_u, corr_start_l,
-                corr_start_p], c='red', label='CO2 and Forest Area')
-plt.scatter(x, [corr_start_r_m, corr_start_u_m, corr_start_l_m,
-                corr_start_p_m], c='blue', label='CO2 and Mortality Rate')
-plt.scatter(x, [corr_start_r_e, corr_start_u_e, corr_start_l_e,
-                corr_start_p_e], c='green', label='CO2 and Electric Power Consumption')
-plt.xlabel('Country')
-plt.ylabel('Correlation Coefficient')
-plt.title('Start 20 years Correlation')
-plt.legend()
-plt.grid(True)
-plt.savefig('Start 20 years Correlation')
-plt.show()
-
-# Plotting recent 20 years for all indicators and income groups
-x = ['China', 'Thailand', 'Iran', 'Sudan']
-plt.figure(figsize=(10, 6))
-plt.scatter(x, [corr_rec_r, corr_rec_u, corr_rec_l,
-                corr_rec_p], c='red', label='CO2 and Forest Area')
-plt.scatter(x, [corr_rec_r_m, corr_rec_u_m, corr_rec_l_m,
-                corr_rec_p_m], c='blue', label='CO2 and Mortality Rate')
-plt.scatter(x, [corr_rec_r_e, corr_rec_u_e, corr_rec_l_e,
-                corr_rec_p_e], c='green', label='CO2 and Electric Power Consumption')
-plt.xlabel('Country')
-plt.ylabel('Correlation Coefficient')
-plt.title('Recent 20 years Correlation')
-plt.legend()
-plt.grid(True)
-plt.savefig('Recent 20 years Correlation')
-plt.show()
+        transposed, one column per (Country Code, Indicator Code, Country
+        Name, IncomeGroup)
+    """
+    if indicators is None:
+        indicators = INDICATORS
+    if income is None:
+        income = load_income_groups()
+    else:
+        income = _income_table(income)
+
+    df_filtered = None
+    mapped = False
+    if cache_dir is not None:
+        with stage('cache_read') as record:
+            stem, prefix = _entry_paths(filename, cache_dir, indicators,
+                                        value_dtype, income, fill_value)
+            if mmap:
+                df_filtered = open_value_matrix(stem)
+                mapped = df_filtered is not None
+            if df_filtered is None:
+                df_filtered = _read_cached_frame(stem)
+            record['hit'] = df_filtered is not None
+
+    if df_filtered is None:
+        df_filtered = _load_worldbank_frame(filename, indicators, income,
+                                            chunksize, value_dtype,
+                                            fill_value)
+        if cache_dir is not None:
+            with stage('cache_write'):
+                _write_cached_frame(df_filtered, stem, prefix)
+
+    if mmap and cache_dir is not None and not mapped:
+        with stage('value_matrix_write'):
+            write_value_matrix(df_filtered, stem)
+            matrix = open_value_matrix(stem)
+            if matrix is not None:
+                df_filtered = matrix
+
+    return df_filtered, _transpose(df_filtered)
+
+
+def _transpose(df_filtered):
+    """
+    Transpose the dataframe to get years as rows and one column per series.
+    The Country Code and Indicator Code of every series are kept as the
+    first levels of the columns.
+    """
+    with stage('transpose', rows=len(df_filtered)):
+        return df_filtered.set_index(['Country Name', 'IncomeGroup'],
+                                     append=True).T
+
+
+async def read_worldbank_data_async(filenames, indicators=None,
+                                    income_filename=INCOME_FILENAME,
+                                    chunksize=CHUNK_SIZE,
+                                    value_dtype=VALUE_DTYPE, income=None,
+                                    fill_value=0):
+    """
+    Read several World Bank CSV files, e.g. WDI topic files, and the income
+    table at the same time. Each file is streamed and filtered on its own
+    worker thread, where pandas parses without holding the GIL, so the
+    reads and parses of the files overlap. The rows of all files then go
+    through the same filling, categorising, income lookup and indexing as
+    in read_worldbank_data. A series found in more than one file is taken
+    from the first one. Nothing is cached.
+
+    Args:
+      - filenames (list): The CSV files, all in the World Bank format
+      - indicators (list): Indicator names to keep, defaults to INDICATORS
+      - income_filename (str): File read for the income groups when no
+        income table is passed in
+      - chunksize (int): Number of CSV rows parsed per chunk
+      - value_dtype (str): Dtype of the year columns
+      - income (pd.Series or dict): Income group by Country Code
+      - fill_value (float): Value of missing years, or None to keep NaN
+
+    Returns:
+      - df_filtered, df_filtered_transposed: As read_worldbank_data
+    """
+    if indicators is None:
+        indicators = INDICATORS
+    if income is not None:
+        income = _income_table(income)
+
+    reads = [asyncio.to_thread(_read_indicator_rows, filename, indicators,
+                               chunksize, value_dtype)
+             for filename in filenames]
+    if income is None:
+        reads.append(asyncio.to_thread(load_income_groups, income_filename))
+    parsed = await asyncio.gather(*reads)
+    if income is None:
+        income = parsed.pop()
+
+    with stage('combine', files=len(parsed)):
+        df_filtered = pd.concat(parsed, ignore_index=True).drop_duplicates(
+            INDEX_COLUMNS)
+        # Files covering different years put their year columns in order
+        # of first appearance, so sort them back into calendar order
+        years = sorted(df_filtered.columns.difference(ID_COLUMNS), key=int)
+        df_filtered = df_filtered[[column for column in df_filtered.columns
+                                   if column in ID_COLUMNS] + years]
+    df_filtered = _prepare_frame(df_filtered, income, fill_value)
+
+    return df_filtered, _transpose(df_filtered)
+
+
+def read_worldbank_files(filenames, **kwargs):
+    """
+    Run read_worldbank_data_async to completion from synchronous code.
+
+    Args:
+      - filenames (list): The CSV files, all in the World Bank format
+      - kwargs: Options of read_worldbank_data_async
+
+    Returns:
+      - df_filtered, df_filtered_transposed: As read_worldbank_data
+    """
+    return asyncio.run(read_worldbank_data_async(filenames, **kwargs))
+
+
+def get_series(df, country, indicator, years=None):
+    """
+    Look up series by country code and indicator code in a frame indexed
+    like the one returned by read_worldbank_data, or in any slice or
+    moving average of it. The lookup uses the sorted index instead of
+    row positions.
+
+    Args:
+      - df (pd.DataFrame): Frame indexed by Country Code and Indicator Code
+      - country (str or list): Country code(s), e.g. 'CHN'
+      - indicator (str or list): Indicator code(s), e.g. 'EN.ATM.CO2E.KT'
+      - years (list): Year columns to return, defaults to all of them
+
+    Returns:
+      - series (pd.Series or pd.DataFrame): The values by year for a single
+        country and indicator, or one row per (country, indicator) pair
+        when lists are given
+    """
+    if years is None:
+        years = df.columns[~df.columns.isin(ID_COLUMNS)]
+
+    if isinstance(country, str) and isinstance(indicator, str):
+        return df.loc[(country, indicator), years]
+
+    if isinstance(country, str):
+        country = [country]
+    if isinstance(indicator, str):
+        indicator = [indicator]
+    pairs = pd.MultiIndex.from_product([country, indicator],
+                                       names=INDEX_COLUMNS)
+
+    return df.loc[pairs, years]
+
+
+def period_columns(start_year=START_YEAR, end_year=END_YEAR):
+    """
+    Return the year columns of the most recent 20 years and of the start 20
+    years.
+
+    Args:
+      - start_year (int): First year of the start period
+      - end_year (int): Last year of the recent period
+
+    Returns:
+      - recent (list): Year columns of the recent period
+      - start (list): Year columns of the start period
+    """
+    recent = [str(year) for year in range(end_year - 20, end_year + 1)]
+    start = [str(year) for year in range(start_year, start_year + 21)]
+
+    return recent, start
+
+
+def load_data(filenames=(DATA_FILENAME,)):
+    """
+    Load the indicators of World Bank files for the analysis, with missing
+    years kept as NaN. A single file goes through the cache of
+    read_worldbank_data, several files are read concurrently.
+
+    Args:
+      - filenames (list): The World Bank data files
+
+    Returns:
+      - df_filtered, df_filtered_transposed: As read_worldbank_data
+    """
+    with stage('load', files=len(filenames)):
+        if len(filenames) == 1:
+            return read_worldbank_data(filenames[0], fill_value=None)
+        return read_worldbank_files(filenames, fill_value=None)
+
+
+def print_overview(df_filtered, df_filtered_transposed, stem):
+    """
+    Print the first rows of the loaded frames and the summary statistics
+    of every series and indicator, taken from the catalog persisted under
+    stem, see catalog_stem, instead of describing the frames.
+    """
+    print("Filtered dataframe:")
+    print(df_filtered.head())
+    print("\nTransposed dataframe:")
+    print(df_filtered_transposed.head())
+
+    # Using the catalog to explore the data
+    with stage('catalog', series=len(df_filtered)):
+        catalog = cached_catalog(df_filtered, stem)
+    print(indicator_summary(catalog))
+    print(catalog.drop(columns='checksum'))
+
+
+def income_group_slices(df_filtered):
+    """
+    Print the countries of every income group and slice their rows to the
+    recent and start 20 years.
+
+    Args:
+      - df_filtered (pd.DataFrame): Frame returned by read_worldbank_data
+
+    Returns:
+      - group_slices (dict): (recent, start) slices by income group
+    """
+    # Defining countries by income
+    rich_countries = ['China']
+    lower_middle_income_countries = ['Iran, Islamic Rep.']
+    upper_middle_income_countries = ['Thailand']
+    poor_countries = ['Sudan']
+
+    rich_countries = df_filtered[df_filtered['Country Name'].isin(
+        rich_countries)]
+    lower_middle_income_countries = df_filtered[
+        df_filtered['Country Name'].isin(lower_middle_income_countries)]
+    upper_middle_income_countries = df_filtered[
+        df_filtered['Country Name'].isin(upper_middle_income_countries)]
+    poor_countries = df_filtered[df_filtered['Country Name'].isin(
+        poor_countries)]
+
+    country_groups = {
+        'rich': ['China'],
+        'lower_middle': ['Iran, Islamic Rep.'],
+        'upper_middle': ['Thailand'],
+        'poor': ['Sudan']
+    }
+
+    # Iterate over each group
+    for group_name, countries in country_groups.items():
+        # Filter the DataFrame for countries in the current group
+        group_data = df_filtered[df_filtered['Country Name'].isin(countries)]
+
+        # Group the filtered data by 'Country Name'
+        grouped_data = group_data.groupby('Country Name', observed=True)
+
+        # Print the group name
+        print(group_name)
+
+        # Iterate over each country in the group
+        for country, country_data in grouped_data:
+            print(country)
+            print(country_data)
+
+    # Define the list of columns to include in the dataframes
+    columns_to_include = ['Country Name', 'IncomeGroup', 'Indicator Name']
+
+    # Slice the dataframes for the most recent 20 years and the start 20 years
+    recent_20_years_columns, start_20_years_columns = period_columns()
+
+    rich_countries_recent_20_years = rich_countries[columns_to_include +
+                                                    recent_20_years_columns]
+    rich_countries_start_20_years = rich_countries[columns_to_include +
+                                                   start_20_years_columns]
+
+    lower_middle_income_recent_20_years = lower_middle_income_countries[
+        columns_to_include + recent_20_years_columns]
+    lower_middle_income_start_20_years = lower_middle_income_countries[
+        columns_to_include + start_20_years_columns]
+
+    upper_middle_income_recent_20_years = upper_middle_income_countries[
+        columns_to_include + recent_20_years_columns]
+    upper_middle_income_start_20_years = upper_middle_income_countries[
+        columns_to_include + start_20_years_columns]
+
+    poor_countries_recent_20_years = poor_countries[columns_to_include +
+                                                    recent_20_years_columns]
+    poor_countries_start_20_years = poor_countries[columns_to_include +
+                                                   start_20_years_columns]
+
+    print('poor country:')
+    print(poor_countries_recent_20_years)
+    print(poor_countries_start_20_years)
+
+    return {
+        'rich': (rich_countries_recent_20_years,
+                 rich_countries_start_20_years),
+        'lower_middle': (lower_middle_income_recent_20_years,
+                         lower_middle_income_start_20_years),
+        'upper_middle': (upper_middle_income_recent_20_years,
+                         upper_middle_income_start_20_years),
+        'poor': (poor_countries_recent_20_years,
+                 poor_countries_start_20_years)
+    }
+
+
+def moving_averages(df_filtered, window=MA_WINDOW):
+    """
+    Calculate the moving averages of the recent 20 years and start 20 years
+    for every country and indicator at once. Missing years are kept as NaN,
+    so a window with a missing year has no average instead of counting the
+    year as zero.
+
+    Args:
+      - df_filtered (pd.DataFrame): Frame returned by read_worldbank_data
+      - window (int): Number of years in the moving window
+
+    Returns:
+      - start (Cube): Moving averages of the start 20 years
+      - recent (Cube): Moving averages of the recent 20 years
+    """
+    with stage('build_cube') as record:
+        cube = build_cube(df_filtered)
+        record.update(series=cube.values.shape[0] * cube.values.shape[1],
+                      bytes=cube.values.nbytes)
+    with stage('rolling_mean'):
+        recent = rolling_mean(year_window(cube, END_YEAR - 20, END_YEAR),
+                              window)
+        start = rolling_mean(year_window(cube, START_YEAR, START_YEAR + 20),
+                             window)
+
+    return start, recent
+
+
+def correlate_periods(start_20_years_ma_cube, recent_20_years_ma_cube):
+    """
+    Correlate every pair of indicators for every country in both periods.
+
+    Returns:
+      - correlations (pd.Series): Correlations indexed by Country Code,
+        Window ('start' or 'recent') and the two Indicator Codes
+    """
+    with stage('correlation') as record:
+        correlations = correlation_frame(
+            correlate([start_20_years_ma_cube, recent_20_years_ma_cube]),
+            start_20_years_ma_cube, ['start', 'recent'])
+        record['pairs'] = len(correlations)
+
+    return correlations
+
+
+def print_correlations(correlations):
+    """
+    Print the correlations of CO2 emissions with forest area, mortality
+    rate and electric power consumption for the country of every income
+    group.
+    """
+    print('------------------------'
+          'CO2 AND FOREST AREA-------------------------')
+
+    # Correlation for rich start 20 years Co2 and forest area
+    corr_start_r = correlations['CHN', 'start', CO2, FOREST_AREA]
+    print(corr_start_r)
+
+    # Correlation for rich recent 20 years Co2 and forest area
+    corr_rec_r = correlations['CHN', 'recent', CO2, FOREST_AREA]
+    print(corr_rec_r)
+
+    # Correlation for upper start 20 years Co2 and forest area
+    corr_start_u = correlations['THA', 'start', CO2, FOREST_AREA]
+    print(corr_start_u)
+
+    # Correlation for upper recent 20 years Co2 and forest area
+    corr_rec_u = correlations['THA', 'recent', CO2, FOREST_AREA]
+    print(corr_rec_u)
+
+    # Correlation for lower start 20 years Co2 and forest area
+    corr_start_l = correlations['IRN', 'start', CO2, FOREST_AREA]
+    print(corr_start_l)
+
+    # Correlation for lower recent 20 years Co2 and forest area
+    corr_rec_l = correlations['IRN', 'recent', CO2, FOREST_AREA]
+    print(corr_rec_l)
+
+    # Correlation for poor start 20 years Co2 and forest area
+    corr_start_p = correlations['SDN', 'start', CO2, FOREST_AREA]
+    print(corr_start_p)
+
+    # Correlation for poor recent 20 years Co2 and forest area
+    corr_rec_p = correlations['SDN', 'recent', CO2, FOREST_AREA]
+    print(corr_rec_p)
+
+    print('---------------------CO2 AND MORTALITY RATE-----------------------')
+
+    # Correlation for rich start 20 years Co2 and Mortality rate
+    corr_start_r_m = correlations['CHN', 'start', CO2, MORTALITY]
+    print(corr_start_r_m)
+
+    # Correlation for rich reecent 20 year Co2 and mortality rate
+    corr_rec_r_m = correlations['CHN', 'recent', CO2, MORTALITY]
+    print(corr_rec_r_m)
+
+    # Correlation for upper start 20 years Co2 and mortality rate
+    corr_start_u_m = correlations['THA', 'start', CO2, MORTALITY]
+    print(corr_start_u_m)
+
+
+    # Correlation for upper recent 20 years Co2 and mortality rate
+    corr_rec_u_m = correlations['THA', 'recent', CO2, MORTALITY]
+    print(corr_rec_u_m)
 
+    # Correlation for lower start 20 years Co2 and mortality rate
+    corr_start_l_m = correlations['IRN', 'start', CO2, MORTALITY]
+    print(corr_start_l_m)
+
+    # Correlation for lower recent 20 years Co2 and mortality rate
+    corr_rec_l_m = correlations['IRN', 'recent', CO2, MORTALITY]
+    print(corr_rec_l_m)
+
+    # Correlation for poor start 20 years Co2 and mortality rate
+    corr_start_p_m = correlations['SDN', 'start', CO2, MORTALITY]
+    print(corr_start_p_m)
+
+    # Correlation for lower rceent 20 years Co2 and mortality rate
+    corr_rec_p_m = correlations['SDN', 'recent', CO2, MORTALITY]
+    print(corr_rec_p_m)
+
+
+    print('-----------------'
+          'CO2 AMD ELECTRIC POWER CONSUMPTION-------------------')
+
+    # Correlation for rich start 20 years Co2 and electric power
+    corr_start_r_e = correlations['CHN', 'start', CO2, ELECTRIC_POWER]
+    print(corr_start_r_e)
+
+    # Correlation for rich recent 20 years Co2 and electric power
+    corr_rec_r_e = correlations['CHN', 'recent', CO2, ELECTRIC_POWER]
+    print(corr_rec_r_e)
+
+    # Correlation for upper start 20 years Co2 and electric power
+    corr_start_u_e = correlations['THA', 'start', CO2, ELECTRIC_POWER]
+    print(corr_start_u_e)
+
+
+    # Correlation for upper recent 20 years Co2 and electric power
+    corr_rec_u_e = correlations['THA', 'recent', CO2, ELECTRIC_POWER]
+    print(corr_rec_u_e)
+
+    # Correlation for lower start 20 years Co2 and electric power
+    corr_start_l_e = correlations['IRN', 'start', CO2, ELECTRIC_POWER]
+    print(corr_start_l_e)
+
+    # Correlation for lower recent 20 years Co2 and electric power
+    corr_rec_l_e = correlations['IRN', 'recent', CO2, ELECTRIC_POWER]
+    print(corr_rec_l_e)
+
+    # Correlation for poor start 20 years Co2 and electric power
+    corr_start_p_e = correlations['SDN', 'start', CO2, ELECTRIC_POWER]
+    print(corr_start_p_e)
+
+    # Correlation for poor recemt 20 years Co2 and electric power
+    corr_rec_p_e = correlations['SDN', 'recent', CO2, ELECTRIC_POWER]
+    print(corr_rec_p_e)
+
+
+def export_results(group_slices, recent_20_years_ma, start_20_years_ma,
+                   correlations, path=EXPORT_PATH):
+    """
+    Export the slices, moving averages and correlations of every income
+    group in one batched write instead of one CSV file per slice.
+
+    Args:
+      - group_slices (dict): Slices returned by income_group_slices
+      - recent_20_years_ma (pd.DataFrame): Recent moving averages
+      - start_20_years_ma (pd.DataFrame): Start moving averages
+      - correlations (pd.Series): Correlations returned by
+        correlate_periods
+      - path (str): Directory of the exported dataset
+    """
+    slices = {}
+    for group_name, (recent, start) in group_slices.items():
+        codes = recent.index.get_level_values('Country Code').unique()
+        for window_name, values, averages in [
+                ('recent', recent, recent_20_years_ma),
+                ('start', start, start_20_years_ma)]:
+            slices[group_name, window_name, 'values'] = values
+            slices[group_name, window_name, 'moving_average'] = averages[
+                averages.index.get_level_values(0).isin(codes)]
+            slices[group_name, window_name, 'correlation'] = correlations[
+                (correlations.index.get_level_values(0).isin(codes)) &
+                (correlations.index.get_level_values(1) == window_name)]
+    with stage('export', slices=len(slices)):
+        export_slices(path, slices)
+
+
+def plot_charts(recent_20_years_ma, start_20_years_ma, correlations,
+                output_dir='.'):
+    """
+    Plot the moving averages and correlations of the country of every
+    income group. matplotlib is only imported here, so the other commands
+    start without it.
+
+    Args:
+      - recent_20_years_ma (pd.DataFrame): Recent moving averages
+      - start_20_years_ma (pd.DataFrame): Start moving averages
+      - correlations (pd.Series): Correlations returned by
+        correlate_periods
+      - output_dir (str): Directory the charts are written to
+    """
+    from rendering import Chart, render_charts
+
+    # Charts rendered at the end of the run
+    charts = []
+
+    # Defining variables
+    years, years5 = period_columns()
+
+    # Plotting recent 20 years for CO2 emissions
+    charts.append(Chart(
+        'CO2 emissions rec 20 years',
+        'CO2 emissions (kt) Recent 20 Years Moving Averages',
+        'Year', 'Value', lines=[
+            (years, get_series(recent_20_years_ma, 'CHN', CO2), 'China'),
+            (years, get_series(recent_20_years_ma, 'THA', CO2), 'Thailand'),
+            (years, get_series(recent_20_years_ma, 'IRN', CO2), 'Iran'),
+            (years, get_series(recent_20_years_ma, 'SDN', CO2), 'Sudan')
+        ]))
+
+    # Plotting recent 20 years for Electric Power Consumption
+    charts.append(Chart(
+        'Electric Power Consumption Recent 20 years',
+        'Electric Power Consumption Recent 20 Years Moving Averages',
+        'Year', 'Value', lines=[
+            (years, get_series(recent_20_years_ma, 'CHN', ELECTRIC_POWER),
+             'China'),
+            (years, get_series(recent_20_years_ma, 'THA', ELECTRIC_POWER),
+             'Thailand'),
+            (years, get_series(recent_20_years_ma, 'IRN', ELECTRIC_POWER),
+             'Iran'),
+            (years, get_series(recent_20_years_ma, 'SDN', ELECTRIC_POWER),
+             'Sudan')
+        ]))
+
+    # Plotting start 20 years for CO2 emissions
+    charts.append(Chart(
+        'CO2 emissions start 20 years',
+        'CO2 emissions Start 20 Years Moving Averages',
+        'Year', 'Value', lines=[
+            (years5, get_series(start_20_years_ma, 'CHN', CO2), 'China'),
+            (years5, get_series(start_20_years_ma, 'THA', CO2), 'Thailand'),
+            (years5, get_series(start_20_years_ma, 'IRN', CO2), 'Iran'),
+            (years5, get_series(start_20_years_ma, 'SDN', CO2), 'Sudan')
+        ]))
+
+    # Plotting start 20 years for Electric Power Consumption
+    charts.append(Chart(
+        'Electric power consumption Start 20 years',
+        'Electric Power Consumption Start 20 Years Moving Averages',
+        'Year', 'Value', lines=[
+            (years5, get_series(start_20_years_ma, 'CHN', ELECTRIC_POWER),
+             'China'),
+            (years5, get_series(start_20_years_ma, 'THA', ELECTRIC_POWER),
+             'Thailand'),
+            (years5, get_series(start_20_years_ma, 'IRN', ELECTRIC_POWER),
+             'Iran'),
+            (years5, get_series(start_20_years_ma, 'SDN', ELECTRIC_POWER),
+             'Sudan')
+        ]))
+
+    # Plotting start 20 years for agricultural land
+    charts.append(Chart(
+        'Agriclutural land start 20 years',
+        'Agricultural Land Start 20 Years Moving Averages',
+        'Year', 'Value', lines=[
+            (years5, get_series(start_20_years_ma, 'CHN', AGRICULTURAL_LAND),
+             'China'),
+            (years5, get_series(start_20_years_ma, 'THA', AGRICULTURAL_LAND),
+             'Thailand'),
+            (years5, get_series(start_20_years_ma, 'IRN', AGRICULTURAL_LAND),
+             'Iran'),
+            (years5, get_series(start_20_years_ma, 'SDN', AGRICULTURAL_LAND),
+             'Sudan')
+        ]))
+
+    # Plotting recent 20 years for agricultural land
+    charts.append(Chart(
+        'Agricultural land Recent 20 years',
+        'Agricultural Land Recent 20 Years Moving Averages',
+        'Year', 'Value', lines=[
+            (years, get_series(recent_20_years_ma, 'CHN', AGRICULTURAL_LAND),
+             'China'),
+            (years, get_series(recent_20_years_ma, 'THA', AGRICULTURAL_LAND),
+             'Thailand'),
+            (years, get_series(recent_20_years_ma, 'IRN', AGRICULTURAL_LAND),
+             'Iran'),
+            (years, get_series(recent_20_years_ma, 'SDN', AGRICULTURAL_LAND),
+             'Sudan')
+        ]))
+
+    # Plotting Start 20 years Forest Area
+    charts.append(Chart(
+        'Forest Area start 20 years',
+        'Forest Area Start 20 Years Moving Averages',
+        'Year', 'Value', lines=[
+            (years5, get_series(start_20_years_ma, 'CHN', FOREST_AREA),
+             'China'),
+            (years5, get_series(start_20_years_ma, 'THA', FOREST_AREA),
+             'Thailand'),
+            (years5, get_series(start_20_years_ma, 'IRN', FOREST_AREA),
+             'Iran'),
+            (years5, get_series(start_20_years_ma, 'SDN', FOREST_AREA),
+             'Sudan')
+        ]))
+
+    # Plotting Recent 20 years Forest Area
+    charts.append(Chart(
+        'Forest Area recent 20 years',
+        'Forest Area Recent 20 Years Moving Averages',
+        'Year', 'Value', lines=[
+            (years, get_series(recent_20_years_ma, 'CHN', FOREST_AREA),
+             'China'),
+            (years, get_series(recent_20_years_ma, 'THA', FOREST_AREA),
+             'Thailand'),
+            (years, get_series(recent_20_years_ma, 'IRN', FOREST_AREA),
+             'Iran'),
+            (years, get_series(recent_20_years_ma, 'SDN', FOREST_AREA),
+             'Sudan')
+        ]))
+
+    # Plotting the correlations of both periods for all indicators and
+    # income groups
+    x = ['China', 'Thailand', 'Iran', 'Sudan']
+    for window_name, title in [('start', 'Start 20 years Correlation'),
+                               ('recent', 'Recent 20 years Correlation')]:
+        charts.append(Chart(
+            title, title, 'Country', 'Correlation Coefficient', points=[
+                (x, [correlations[country, window_name, CO2, other]
+                       for country in CHART_COUNTRIES], label, color)
+                for other, label, color in [
+                    (FOREST_AREA, 'CO2 and Forest Area', 'red'),
+                    (MORTALITY, 'CO2 and Mortality Rate', 'blue'),
+                    (ELECTRIC_POWER, 'CO2 and Electric Power Consumption',
+                     'green')]
+            ]))
+
+    # Render every chart headlessly and report the throughput
+    with stage('render', figures=len(charts)):
+        stats = render_charts(charts, output_dir)
+    print('Rendered {figures} figures in {seconds:.2f}s '
+          '({figures_per_second:.1f} figures/s)'.format(**stats))
+
+
+def main(argv=None):
+    """
+    Run the analysis from the command line. Without a command every step
+    runs, in order: load, analyse, correlate, export and plot.
+
+    Set WB_TRACE to a filename to record the time of every stage in a
+    Chrome trace, and WB_TRACE_MEMORY=1 to record their peak memory too.
+
+    Args:
+      - argv (list): Command line arguments, defaults to sys.argv[1:]
+    """
+    parser = argparse.ArgumentParser(
+        description='Analyse World Bank climate indicators')
+    parser.add_argument('--data', action='append',
+                        help='World Bank data file, repeat to combine '
+                             'several files')
+    commands = parser.add_subparsers(dest='command')
+    commands.add_parser('load', help='print the loaded data')
+    commands.add_parser('analyse',
+                        help='print the income group slices and the '
+                             'moving averages')
+    commands.add_parser('correlate', help='print the correlations')
+    export = commands.add_parser('export',
+                                 help='export slices, moving averages '
+                                      'and correlations')
+    export.add_argument('--output', default=EXPORT_PATH)
+    plot = commands.add_parser('plot', help='plot the charts')
+    plot.add_argument('--output-dir', default='.')
+    args = parser.parse_args(argv)
+    command = args.command
+
+    trace = os.environ.get(TRACE_ENV)
+    if trace:
+        enable(memory=os.environ.get(TRACE_MEMORY_ENV) == '1')
+
+    filenames = args.data or [DATA_FILENAME]
+    df_filtered, df_filtered_transposed = load_data(filenames)
+    if command in (None, 'load'):
+        print_overview(df_filtered, df_filtered_transposed,
+                       catalog_stem(filenames))
+
+    if command in (None, 'analyse', 'export'):
+        group_slices = income_group_slices(df_filtered)
+
+    if command != 'load':
+        start_cube, recent_cube = moving_averages(df_filtered)
+        recent_20_years_ma = cube_to_frame(recent_cube)
+        start_20_years_ma = cube_to_frame(start_cube)
+    if command == 'analyse':
+        print(recent_20_years_ma)
+        print(start_20_years_ma)
+
+    if command in (None, 'correlate', 'export', 'plot'):
+        correlations = correlate_periods(start_cube, recent_cube)
+    if command in (None, 'correlate'):
+        print_correlations(correlations)
+
+    if command in (None, 'export'):
+        export_results(group_slices, recent_20_years_ma, start_20_years_ma,
+                       correlations, getattr(args, 'output', EXPORT_PATH))
+
+    if command in (None, 'plot'):
+        plot_charts(recent_20_years_ma, start_20_years_ma, correlations,
+                    getattr(args, 'output_dir', '.'))
+
+    if trace:
+        write_trace(trace)
+
+
+if __name__ == '__main__':
+    main()
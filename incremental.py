@@ -0,0 +1,188 @@
+import collections
+import json
+
+import numpy as np
+import pandas as pd
+
+from cube import (Cube, align_cube, correlate, moving_average, rolling_mean,
+                  year_window)
+
+
+# Moving averages and correlations of a cube for a set of year periods.
+# windows maps each period name to its (start, end) years, averages holds
+# one moving-average cube per period and correlations is the country x
+# period x indicator x indicator array returned by correlate
+Analysis = collections.namedtuple('Analysis', ['cube', 'windows', 'window',
+                                               'method', 'averages',
+                                               'correlations',
+                                               'min_periods'],
+                                  defaults=(None,))
+
+
+def analyse(cube, windows, window=5, method='pearson', min_periods=None):
+    """
+    Compute the moving averages and correlations of every period of a cube
+    from scratch.
+
+    Args:
+      - cube (Cube): Cube built by build_cube
+      - windows (dict): (start, end) years of each period, by period name
+      - window (int): Number of years in the moving window
+      - method (str): 'pearson' or 'spearman'
+      - min_periods (int): Valid years needed for a moving average,
+        defaults to window
+
+    Returns:
+      - analysis (Analysis): The cube with its averages and correlations
+    """
+    averages = [rolling_mean(year_window(cube, start, end), window,
+                             min_periods)
+                for start, end in windows.values()]
+
+    return Analysis(cube, dict(windows), window, method, averages,
+                    correlate(averages, method), min_periods)
+
+
+def changed_cells(old, new):
+    """
+    Compare two releases cell by cell. Cells of economies, indicators or
+    years that are new count as changed; cells missing in both do not.
+
+    Args:
+      - old (Cube): Cube of the previous release
+      - new (Cube): Cube of the new release
+
+    Returns:
+      - changed (np.ndarray): Boolean mask with the shape of new.values
+    """
+    aligned = align_cube(old, new.countries, new.indicators, new.years)
+    both_missing = np.isnan(aligned.values) & np.isnan(new.values)
+
+    return ~both_missing & (aligned.values != new.values)
+
+
+def _align_correlations(previous, countries, indicators):
+    """
+    Reindex the correlations of a previous analysis onto new country and
+    indicator labels. Pairs that did not exist before are NaN.
+    """
+    country_pos = pd.Index(previous.cube.countries).get_indexer(countries)
+    indicator_pos = pd.Index(previous.cube.indicators).get_indexer(
+        indicators)
+    countries_kept = np.flatnonzero(country_pos >= 0)
+    indicators_kept = np.flatnonzero(indicator_pos >= 0)
+
+    correlations = np.full((len(countries), len(previous.windows),
+                            len(indicators), len(indicators)), np.nan)
+    periods = np.arange(len(previous.windows))
+    correlations[np.ix_(countries_kept, periods, indicators_kept,
+                        indicators_kept)] = previous.correlations[np.ix_(
+                            country_pos[countries_kept], periods,
+                            indicator_pos[indicators_kept],
+                            indicator_pos[indicators_kept])]
+
+    return correlations
+
+
+def refresh(previous, cube):
+    """
+    Bring an analysis up to date with a new release. Only the series with
+    a changed cell get their moving average recomputed, and only from the
+    first changed year of the period onwards. Only the countries with a
+    recomputed series get their correlation matrices recomputed.
+
+    Args:
+      - previous (Analysis): Analysis of the previous release
+      - cube (Cube): Cube of the new release
+
+    Returns:
+      - analysis (Analysis): Analysis of the new release
+      - stats (dict): Number of changed cells, recomputed series and
+        recomputed country correlation matrices
+    """
+    changed = changed_cells(previous.cube, cube)
+    changed_cube = cube._replace(values=changed)
+    correlations = _align_correlations(previous, cube.countries,
+                                       cube.indicators)
+    stats = {'changed_cells': int(changed.sum()), 'recomputed_series': 0,
+             'recomputed_countries': 0}
+
+    averages = []
+    for period, (start, end) in enumerate(previous.windows.values()):
+        values = year_window(cube, start, end)
+        old = align_cube(previous.averages[period], cube.countries,
+                         cube.indicators, values.years)
+        period_changed = year_window(changed_cube, start, end).values
+        rows = period_changed.any(axis=-1)
+
+        if rows.any():
+            # Averages before the first changed year keep their old value
+            first = int(np.argmax(period_changed[rows], axis=-1).min())
+            lead = max(0, first - previous.window + 1)
+            old.values[rows, first:] = moving_average(
+                values.values[rows][:, lead:], previous.window,
+                previous.min_periods)[:, first - lead:]
+            stats['recomputed_series'] += int(rows.sum())
+
+        touched = rows.any(axis=-1)
+        if touched.any():
+            subset = Cube(old.values[touched],
+                          list(np.asarray(cube.countries)[touched]),
+                          cube.indicators, old.years)
+            correlations[touched, period] = correlate(
+                [subset], previous.method)[:, 0]
+            stats['recomputed_countries'] += int(touched.sum())
+
+        averages.append(old)
+
+    return previous._replace(cube=cube, averages=averages,
+                             correlations=correlations), stats
+
+
+def save_analysis(analysis, path):
+    """
+    Save an analysis to a .npz file so the next release can be refreshed
+    against it.
+
+    Args:
+      - analysis (Analysis): The analysis to save
+      - path (str): Destination .npz file
+    """
+    labels = {'countries': analysis.cube.countries,
+              'indicators': analysis.cube.indicators,
+              'years': analysis.cube.years,
+              'windows': analysis.windows,
+              'window': analysis.window,
+              'method': analysis.method,
+              'min_periods': analysis.min_periods}
+    averages = {'averages_{}'.format(period): average.values
+                for period, average in enumerate(analysis.averages)}
+
+    np.savez(path, labels=np.array(json.dumps(labels)),
+             cube=analysis.cube.values,
+             correlations=analysis.correlations, **averages)
+
+
+def load_analysis(path):
+    """
+    Load an analysis saved by save_analysis.
+
+    Args:
+      - path (str): The .npz file
+
+    Returns:
+      - analysis (Analysis): The saved analysis
+    """
+    with np.load(path) as data:
+        labels = json.loads(str(data['labels']))
+        cube = Cube(data['cube'], labels['countries'], labels['indicators'],
+                    labels['years'])
+        windows = {name: tuple(years)
+                   for name, years in labels['windows'].items()}
+        averages = [year_window(cube, start, end)._replace(
+                        values=data['averages_{}'.format(period)])
+                    for period, (start, end) in enumerate(windows.values())]
+
+        return Analysis(cube, windows, labels['window'], labels['method'],
+                        averages, data['correlations'],
+                        labels.get('min_periods'))
@@ -0,0 +1,164 @@
+import collections
+import warnings
+
+import numpy as np
+
+
+# Two-sided Student t quantiles computed so far, by (level, df)
+_t_quantiles = {}
+
+# Fitted line and bands of a batch of regressions on a grid of x values,
+# each with the shape batch x grid: ci bands are for the mean response and
+# pi bands for a new observation
+Bands = collections.namedtuple('Bands', ['x', 'fitted', 'ci_lower',
+                                         'ci_upper', 'pi_lower', 'pi_upper'])
+
+
+def t_quantile(level, df):
+    """
+    Return the two-sided Student t quantile of a confidence level, i.e.
+    the (1 + level) / 2 quantile, for one or many degrees of freedom.
+    Quantiles are cached by (level, df), so only degrees of freedom not
+    seen before at this level call scipy.
+
+    Args:
+      - level (float): Confidence level, e.g. 0.95
+      - df (int or np.ndarray): Degrees of freedom
+
+    Returns:
+      - quantile (float or np.ndarray): Quantiles with the shape of df, NaN
+        where df < 1
+    """
+    df = np.asarray(df, dtype='float64')
+    usable = np.isfinite(df) & (df >= 1)
+    unique, inverse = np.unique(np.where(usable, df, 0.0).astype('int64'),
+                                return_inverse=True)
+
+    missing = [value for value in unique
+               if value >= 1 and (level, value) not in _t_quantiles]
+    if missing:
+        from scipy.stats import t
+
+        for value, quantile in zip(missing, t.ppf((1.0 + level) / 2.0,
+                                                  missing)):
+            _t_quantiles[level, value] = float(quantile)
+
+    quantiles = np.array([_t_quantiles.get((level, value), np.nan)
+                          for value in unique])
+    quantiles = np.where(usable, quantiles[inverse.reshape(df.shape)],
+                         np.nan)
+
+    return quantiles if quantiles.ndim else float(quantiles)
+
+
+def x_grid(x, points=200):
+    """
+    Build an evenly spaced grid over the x range of every regression of a
+    batch.
+
+    Args:
+      - x (np.ndarray): Predictor values, regressions on the leading axes
+        and points on the last one
+      - points (int): Number of grid points
+
+    Returns:
+      - grid (np.ndarray): Grid of shape batch x points
+    """
+    low = np.where(np.isnan(x), np.inf, x).min(axis=-1)
+    high = np.where(np.isnan(x), -np.inf, x).max(axis=-1)
+    low, high = (np.where(np.isfinite(low), low, np.nan),
+                 np.where(np.isfinite(high), high, np.nan))
+
+    return np.linspace(low, high, points, axis=-1)
+
+
+def _standard_errors(fits, x):
+    """
+    Standard errors of the mean response and of a new observation at x,
+    broadcast over the batch of fits and the last axis of x.
+    """
+    stats = fits.stats
+    n = np.asarray(stats.n, dtype='float64')[..., None]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        spread = 1.0 / n + ((x - stats.mean_x[..., None]) ** 2 /
+                            stats.sxx[..., None])
+        mse = fits.mse[..., None]
+
+        return np.sqrt(mse * spread), np.sqrt(mse * (1.0 + spread))
+
+
+def bands(fits, x, ci_level=0.95, pi_level=0.95):
+    """
+    Evaluate the fitted lines, confidence bands for the mean response and
+    prediction bands for new observations of a batch of regressions.
+
+    Args:
+      - fits (Fit): Fits from regression.fit or regression.regress
+      - x (np.ndarray): x values of every regression on the last axis,
+        e.g. from x_grid, broadcastable with the batch shape plus one
+      - ci_level (float): Level of the confidence bands
+      - pi_level (float): Level of the prediction bands
+
+    Returns:
+      - bands (Bands): The lines and bands, broadcast to batch x points
+    """
+    x = np.asarray(x, dtype='float64')
+    fitted = fits.intercept[..., None] + fits.slope[..., None] * x
+    se_mean, se_new = _standard_errors(fits, x)
+    # t_quantile returns a float for a single regression
+    ci = np.asarray(t_quantile(ci_level, fits.df))[..., None] * se_mean
+    pi = np.asarray(t_quantile(pi_level, fits.df))[..., None] * se_new
+    x = np.broadcast_to(x, fitted.shape)
+
+    return Bands(x, fitted, fitted - ci, fitted + ci, fitted - pi,
+                 fitted + pi)
+
+
+def mean_response(fits, x, percentile, level=0.95):
+    """
+    Estimate the mean response of every regression of a batch at a
+    percentile of its predictor, with its confidence interval.
+
+    Args:
+      - fits (Fit): Fits of regressions on these x values
+      - x (np.ndarray): Predictor values of the regressions
+      - percentile (float): Percentile of x, between 0 and 100
+      - level (float): Level of the confidence interval
+
+    Returns:
+      - x0 (np.ndarray): The percentile of x of every regression
+      - response (np.ndarray): The mean response at x0
+      - lower (np.ndarray): Lower end of its confidence interval
+      - upper (np.ndarray): Upper end of its confidence interval
+    """
+    with warnings.catch_warnings():
+        # Regressions without any x value get NaN
+        warnings.simplefilter('ignore', RuntimeWarning)
+        x0 = np.nanpercentile(x, percentile, axis=-1)
+    response = fits.intercept + fits.slope * x0
+    se_mean = _standard_errors(fits, x0[..., None])[0][..., 0]
+    margin = t_quantile(level, fits.df) * se_mean
+
+    return x0, response, response - margin, response + margin
+
+
+def coefficient_intervals(fits, level=0.95):
+    """
+    Confidence intervals of the intercepts and slopes of a batch of
+    regressions.
+
+    Args:
+      - fits (Fit): The fits
+      - level (float): Confidence level
+
+    Returns:
+      - intervals (dict): (lower, upper) arrays of 'intercept' and 'slope'
+    """
+    quantile = t_quantile(level, fits.df)
+    intervals = {}
+    for name in ('intercept', 'slope'):
+        margin = quantile * getattr(fits, 'se_' + name)
+        intervals[name] = (getattr(fits, name) - margin,
+                           getattr(fits, name) + margin)
+
+    return intervals
@@ -0,0 +1,147 @@
+import contextlib
+import functools
+import json
+import os
+import threading
+import time
+import tracemalloc
+
+
+# Recorded stages and switches of the tracer. Tracing is off until enable
+# is called, and stage then costs one dictionary lookup
+_tracer = {'enabled': False, 'memory': False, 'events': []}
+
+
+class _NullRecord:
+    """
+    Counter record handed out while tracing is off. Writes are ignored.
+    """
+
+    def __setitem__(self, key, value):
+        pass
+
+    def update(self, *args, **kwargs):
+        pass
+
+
+_NULL_RECORD = _NullRecord()
+
+
+def enable(memory=False):
+    """
+    Switch tracing on and forget previously recorded stages.
+
+    Args:
+      - memory (bool): Also record the peak tracemalloc memory of each
+        stage. This slows the traced code down noticeably
+    """
+    _tracer.update(enabled=True, memory=memory, events=[])
+    if memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+
+def disable():
+    """
+    Switch tracing off. Recorded stages are kept until the next enable.
+    """
+    _tracer['enabled'] = False
+    if _tracer['memory'] and tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+
+def is_enabled():
+    """
+    Return whether stages are being recorded.
+    """
+    return _tracer['enabled']
+
+
+@contextlib.contextmanager
+def stage(name, **counters):
+    """
+    Time the enclosed block as a pipeline stage. The yielded record takes
+    extra counters such as rows and bytes, e.g. record['rows'] = len(df).
+    Nested stages are allowed; with memory tracing the peak of an outer
+    stage only covers the part after its last nested stage.
+
+    Args:
+      - name (str): Name of the stage in the trace
+      - counters: Counters known before the stage starts
+    """
+    if not _tracer['enabled']:
+        yield _NULL_RECORD
+        return
+
+    record = dict(counters)
+    if _tracer['memory']:
+        tracemalloc.reset_peak()
+        memory_start = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter_ns()
+    try:
+        yield record
+    finally:
+        end = time.perf_counter_ns()
+        if _tracer['memory']:
+            record['peak_bytes'] = (tracemalloc.get_traced_memory()[1] -
+                                    memory_start)
+        _tracer['events'].append({
+            'name': name, 'start_ns': start, 'duration_ns': end - start,
+            'pid': os.getpid(), 'tid': threading.get_ident(),
+            'counters': record
+        })
+
+
+def profiled(name=None):
+    """
+    Decorator recording every call of a function as a stage.
+
+    Args:
+      - name (str): Name of the stage, defaults to the function name
+    """
+    def decorator(function):
+        stage_name = name or function.__name__
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _tracer['enabled']:
+                return function(*args, **kwargs)
+            with stage(stage_name):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def events():
+    """
+    Return the recorded stages in the order they finished.
+    """
+    return list(_tracer['events'])
+
+
+def write_trace(path, chrome=True):
+    """
+    Write the recorded stages to a JSON file.
+
+    Args:
+      - path (str): Destination file
+      - chrome (bool): Write the Chrome trace event format, which can be
+        opened in chrome://tracing or Perfetto, instead of a plain list of
+        stages
+    """
+    recorded = events()
+    if chrome:
+        origin = min((event['start_ns'] for event in recorded), default=0)
+        trace = {'traceEvents': [{
+            'name': event['name'], 'ph': 'X', 'cat': 'pipeline',
+            'ts': (event['start_ns'] - origin) / 1000.0,
+            'dur': event['duration_ns'] / 1000.0,
+            'pid': event['pid'], 'tid': event['tid'],
+            'args': event['counters']
+        } for event in recorded]}
+    else:
+        trace = recorded
+
+    with open(path, 'w') as f:
+        json.dump(trace, f, indent=1, default=int)
@@ -0,0 +1,209 @@
+import collections
+
+import numpy as np
+import pandas as pd
+
+from cube import build_cube
+
+
+# Sufficient statistics of a batch of simple linear regressions of y on x.
+# Every field is an array with the batch shape: the number of points, the
+# means of x and y, and the centred sums of squares and cross products
+# Sxx = sum((x - mean_x)^2), Sxy and Syy
+Stats = collections.namedtuple('Stats', ['n', 'mean_x', 'mean_y', 'sxx',
+                                         'sxy', 'syy'])
+
+# A batch of fitted simple linear regressions, with the ANOVA quantities:
+# ssr is the regression sum of squares, sse the residual one and sst the
+# total one, df = n - 2 the residual degrees of freedom, mse = sse / df,
+# f the ANOVA F statistic of the regression and r2 = ssr / sst
+Fit = collections.namedtuple('Fit', ['stats', 'intercept', 'slope',
+                                     'se_intercept', 'se_slope', 'ssr',
+                                     'sse', 'sst', 'df', 'mse', 'f', 'r2'])
+
+# Columns of the frame returned by fit_frame
+FIT_COLUMNS = ['n', 'intercept', 'slope', 'se_intercept', 'se_slope', 'ssr',
+               'sse', 'sst', 'df', 'mse', 'f', 'r2']
+
+
+def sufficient_stats(x, y):
+    """
+    Compute the sufficient statistics of a batch of regressions of y on x
+    along the last axis. Points where x or y is NaN are left out.
+
+    Args:
+      - x (np.ndarray): Predictor values, broadcastable with y
+      - y (np.ndarray): Response values
+
+    Returns:
+      - stats (Stats): Statistics with the batch shape of x and y
+    """
+    x, y = np.broadcast_arrays(np.asarray(x, dtype='float64'),
+                               np.asarray(y, dtype='float64'))
+    valid = ~np.isnan(x) & ~np.isnan(y)
+    n = valid.sum(axis=-1)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean_x = np.where(valid, x, 0.0).sum(axis=-1) / n
+        mean_y = np.where(valid, y, 0.0).sum(axis=-1) / n
+    dx = np.where(valid, x - mean_x[..., None], 0.0)
+    dy = np.where(valid, y - mean_y[..., None], 0.0)
+
+    return Stats(n, mean_x, mean_y, (dx * dx).sum(axis=-1),
+                 (dx * dy).sum(axis=-1), (dy * dy).sum(axis=-1))
+
+
+def pair_stats(values):
+    """
+    Compute the sufficient statistics of the regression of every series on
+    every other series of a batch, each pair using the points where both
+    series are valid. The sums come from masked matrix products, as in
+    cube.correlate, so no pairwise copy of the data is made.
+
+    Args:
+      - values (np.ndarray): Array of shape ... x series x points, e.g. the
+        values of a Cube
+
+    Returns:
+      - stats (Stats): Statistics of shape ... x series x series, where
+        [..., i, j] is the regression of series i on series j
+    """
+    valid = ~np.isnan(values)
+    mask = valid.astype('float64')
+
+    # Centre every series first to keep the sums of squares well scaled
+    counts = np.maximum(mask.sum(axis=-1, keepdims=True), 1.0)
+    means = np.where(valid, values, 0.0).sum(axis=-1, keepdims=True) / counts
+    centred = np.where(valid, values - means, 0.0)
+
+    mask_t = np.swapaxes(mask, -1, -2)
+    centred_t = np.swapaxes(centred, -1, -2)
+    n = mask @ mask_t
+    sum_x = mask @ centred_t
+    sum_y = centred @ mask_t
+    sum_xx = mask @ (centred_t * centred_t)
+    sum_yy = (centred * centred) @ mask_t
+    sum_xy = centred @ centred_t
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean_x = np.swapaxes(means, -1, -2) + sum_x / n
+        mean_y = means + sum_y / n
+        sxx = sum_xx - sum_x * sum_x / n
+        syy = sum_yy - sum_y * sum_y / n
+        sxy = sum_xy - sum_x * sum_y / n
+
+    return Stats(n.round().astype('int64'), mean_x, mean_y, sxx, sxy, syy)
+
+
+def fit(stats):
+    """
+    Fit a batch of simple linear regressions from their sufficient
+    statistics with the closed-form least squares formulas. A regression
+    with a constant x, or with fewer than 3 points for the standard errors
+    and ANOVA quantities, gives NaN.
+
+    Args:
+      - stats (Stats): Statistics from sufficient_stats or pair_stats
+
+    Returns:
+      - fit (Fit): The fitted regressions, with the batch shape of stats
+    """
+    n = np.asarray(stats.n, dtype='float64')
+    identified = (n >= 2) & (stats.sxx > 0)
+    df = n - 2
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        slope = np.where(identified, stats.sxy / stats.sxx, np.nan)
+        intercept = stats.mean_y - slope * stats.mean_x
+        sst = np.where(n >= 1, stats.syy, np.nan)
+        ssr = slope * stats.sxy
+        sse = np.maximum(sst - ssr, 0.0)
+        mse = np.where(df > 0, sse / df, np.nan)
+        se_slope = np.sqrt(mse / stats.sxx)
+        se_intercept = np.sqrt(mse * (1.0 / n +
+                                      stats.mean_x ** 2 / stats.sxx))
+        f = ssr / mse
+        r2 = np.where(sst > 0, ssr / sst, np.nan)
+
+    return Fit(stats, intercept, slope, se_intercept, se_slope, ssr, sse,
+               sst, df, mse, f, r2)
+
+
+def regress(x, y):
+    """
+    Regress y on x along the last axis for a whole batch at once.
+
+    Args:
+      - x (np.ndarray): Predictor values, broadcastable with y
+      - y (np.ndarray): Response values
+
+    Returns:
+      - fit (Fit): The fitted regressions
+    """
+    return fit(sufficient_stats(x, y))
+
+
+def regress_frame(df, indicators=None, years=None):
+    """
+    Regress every indicator on every other indicator for every economy of
+    a frame returned by read_worldbank_data, over the years where both are
+    present, e.g. CO2 emissions on electric power consumption.
+
+    Args:
+      - df (pd.DataFrame): Frame indexed by Country Code and Indicator Code
+      - indicators (list): Indicator codes, defaults to all of them
+      - years (list): Year columns, defaults to all of them
+
+    Returns:
+      - fits (pd.DataFrame): The FIT_COLUMNS of every regression, indexed
+        by Country Code, Indicator Code (the response) and Other
+        Indicator Code (the predictor)
+    """
+    cube = build_cube(df, indicators=indicators, years=years)
+
+    return fit_frame(fit(pair_stats(cube.values)), cube.countries,
+                     cube.indicators)
+
+
+def fit_frame(fits, countries, indicators):
+    """
+    Label the fits of pair_stats regressions.
+
+    Args:
+      - fits (Fit): Fits of shape country x indicator x indicator
+      - countries (list): Country codes of the first axis
+      - indicators (list): Indicator codes of the last two axes
+
+    Returns:
+      - fits (pd.DataFrame): One row per regression with the FIT_COLUMNS
+    """
+    index = pd.MultiIndex.from_product(
+        [countries, indicators, indicators],
+        names=['Country Code', 'Indicator Code', 'Other Indicator Code'])
+    columns = {name: np.ravel(fits.stats.n if name == 'n'
+                              else getattr(fits, name))
+               for name in FIT_COLUMNS}
+
+    return pd.DataFrame(columns, index=index)
+
+
+def anova_table(fit):
+    """
+    Build the analysis of variance table of a single regression, laid out
+    like the one of the A1 notebook.
+
+    Args:
+      - fit (Fit): A fit with a scalar batch shape
+
+    Returns:
+      - table (pd.DataFrame): d.o.f., SS, MS and F of the regression, the
+        residuals and the total
+    """
+    df = float(fit.df)
+
+    return pd.DataFrame({
+        'd.o.f.': [1.0, df, df + 1.0],
+        'SS': [float(fit.ssr), float(fit.sse), float(fit.sst)],
+        'MS': [float(fit.ssr), float(fit.mse), np.nan],
+        'F': [float(fit.f), np.nan, np.nan]
+    }, index=['Regression', 'Residual', 'Total'])
@@ -0,0 +1,109 @@
+import collections
+import concurrent.futures
+import os
+import time
+
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+
+# Size of every figure, in inches
+FIGSIZE = (10, 6)
+
+# A chart to render. lines holds (x, y, label) tuples drawn with plot and
+# points holds (x, y, label, color) tuples drawn with scatter
+Chart = collections.namedtuple(
+    'Chart', ['filename', 'title', 'xlabel', 'ylabel', 'lines', 'points'],
+    defaults=((), ()))
+
+# Figure and axes reused by every chart rendered in this process
+_template = {}
+
+
+def _template_axes():
+    """
+    Return this process's figure and axes template, cleared for the next
+    chart. The figure is drawn on an Agg canvas and never touches pyplot.
+    """
+    if 'axes' not in _template:
+        figure = Figure(figsize=FIGSIZE)
+        FigureCanvasAgg(figure)
+        _template['figure'] = figure
+        _template['axes'] = figure.add_subplot()
+
+    axes = _template['axes']
+    axes.clear()
+
+    return _template['figure'], axes
+
+
+def render_chart(chart, output_dir='.', formats=('png',)):
+    """
+    Draw a chart on the figure template and save it in every format.
+
+    Args:
+      - chart (Chart): The chart to draw
+      - output_dir (str): Directory the files are written to
+      - formats (tuple): File extensions to write, e.g. ('png', 'svg')
+
+    Returns:
+      - paths (list): The files written
+    """
+    figure, axes = _template_axes()
+    for x, y, label in chart.lines:
+        axes.plot(x, y, label=label)
+    for x, y, label, color in chart.points:
+        axes.scatter(x, y, c=color, label=label)
+
+    axes.set_xlabel(chart.xlabel)
+    axes.set_ylabel(chart.ylabel)
+    axes.set_title(chart.title)
+    axes.legend()
+    axes.grid(True)
+
+    paths = []
+    for extension in formats:
+        path = os.path.join(output_dir, chart.filename + '.' + extension)
+        figure.savefig(path)
+        paths.append(path)
+
+    return paths
+
+
+def render_charts(charts, output_dir='.', formats=('png',), workers=None):
+    """
+    Render charts headlessly on a process pool, each worker reusing its own
+    figure template. With a single worker the charts are rendered in this
+    process.
+
+    Args:
+      - charts (list): The charts to draw
+      - output_dir (str): Directory the files are written to
+      - formats (tuple): File extensions to write, e.g. ('png', 'svg')
+      - workers (int): Number of worker processes, defaults to the CPU count
+
+    Returns:
+      - stats (dict): Number of figures and files written, elapsed seconds
+        and figures per second
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    if workers is None:
+        workers = min(os.cpu_count(), len(charts)) or 1
+
+    start = time.perf_counter()
+    if workers == 1:
+        paths = [render_chart(chart, output_dir, formats)
+                 for chart in charts]
+    else:
+        with concurrent.futures.ProcessPoolExecutor(workers) as pool:
+            chunksize = max(1, len(charts) // (workers * 4))
+            paths = list(pool.map(render_chart, charts,
+                                  [output_dir] * len(charts),
+                                  [formats] * len(charts),
+                                  chunksize=chunksize))
+    seconds = time.perf_counter() - start
+
+    return {'figures': len(charts),
+            'files': sum(len(chart_paths) for chart_paths in paths),
+            'seconds': seconds,
+            'figures_per_second': len(charts) / seconds if seconds else 0.0}
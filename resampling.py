@@ -0,0 +1,208 @@
+import collections
+import concurrent.futures
+import os
+import warnings
+
+import numpy as np
+
+
+# Bootstrap summary of one statistic for a batch of series: the observed
+# value, the standard error and percentile interval of the replicates, and
+# the replicates themselves on the last axis
+Interval = collections.namedtuple('Interval', ['observed', 'se', 'lower',
+                                               'upper', 'replicates'])
+
+# Permutation test of one statistic for a batch of series: the observed
+# value, the two-sided p-value and the replicates on the last axis
+Test = collections.namedtuple('Test', ['observed', 'p_value', 'replicates'])
+
+# Number of values drawn at a time for a block of replicates, which bounds
+# the memory of every block
+BLOCK_VALUES = 1 << 22
+
+# Compacted series resampled by the blocks of this process
+_data = {}
+
+
+def _share(x, y, counts):
+    """
+    Worker initializer: keep the compacted series for every block run by
+    this process, so they are sent once per worker instead of once per
+    block.
+    """
+    _data.update(x=x, y=y, counts=counts)
+
+
+def _compact(x, y):
+    """
+    Move the points where both x and y are valid to the front of every
+    series, keeping their order, and count them.
+    """
+    valid = ~np.isnan(x) & ~np.isnan(y)
+    order = np.argsort(~valid, axis=-1, kind='stable')
+
+    return (np.take_along_axis(x, order, axis=-1),
+            np.take_along_axis(y, order, axis=-1), valid.sum(axis=-1))
+
+
+def _statistics(x, y, mask):
+    """
+    Pearson correlation and least squares slope of y on x along the last
+    axis, using the points where mask is set.
+    """
+    with np.errstate(invalid='ignore', divide='ignore'):
+        n = mask.sum(axis=-1)
+        dx = np.where(mask, x - (np.where(mask, x, 0.0).sum(axis=-1) /
+                                 n)[..., None], 0.0)
+        dy = np.where(mask, y - (np.where(mask, y, 0.0).sum(axis=-1) /
+                                 n)[..., None], 0.0)
+        sxx = np.einsum('...k,...k->...', dx, dx)
+        syy = np.einsum('...k,...k->...', dy, dy)
+        sxy = np.einsum('...k,...k->...', dx, dy)
+        r = np.clip(sxy / np.sqrt(sxx * syy), -1.0, 1.0)
+        slope = sxy / sxx
+
+    usable = n >= 3
+    return np.where(usable, r, np.nan), np.where(usable, slope, np.nan)
+
+
+def _replicate_block(kind, seed, size):
+    """
+    Run a block of bootstrap or permutation replicates of every shared
+    series. Every replicate is an index matrix over the valid points of
+    each series, drawn from the block's own random stream.
+
+    Returns:
+      - r (np.ndarray): Correlations of shape series x size
+      - slope (np.ndarray): Slopes of shape series x size
+    """
+    x, y, counts = _data['x'], _data['y'], _data['counts']
+    rng = np.random.default_rng(seed)
+    shape = (x.shape[0], size, x.shape[1])
+    mask = (np.arange(x.shape[1]) < counts[:, None])[:, None, :]
+
+    if kind == 'bootstrap':
+        # Draw points with replacement among the valid ones
+        index = (rng.random(shape) * counts[:, None, None]).astype('int64')
+        index = np.minimum(index, np.maximum(counts - 1, 0)[:, None, None])
+        xs = np.take_along_axis(x[:, None, :], index, axis=-1)
+        ys = np.take_along_axis(y[:, None, :], index, axis=-1)
+    else:
+        # Shuffle y among the valid points, keeping x in place
+        keys = np.where(mask, rng.random(shape), np.inf)
+        xs = x[:, None, :]
+        ys = np.take_along_axis(y[:, None, :], np.argsort(keys, axis=-1),
+                                axis=-1)
+
+    return _statistics(xs, ys, mask)
+
+
+def _resample(kind, x, y, replicates, workers, seed):
+    """
+    Run replicates of the correlation and slope of every series in blocks,
+    on a process pool unless workers is 1. Block sizes and random streams
+    depend only on the data, the number of replicates and the seed, so the
+    result does not depend on the number of workers.
+    """
+    x, y = np.broadcast_arrays(np.asarray(x, dtype='float64'),
+                               np.asarray(y, dtype='float64'))
+    shape = x.shape[:-1]
+    x, y, counts = _compact(x.reshape(-1, x.shape[-1]),
+                            y.reshape(-1, y.shape[-1]))
+
+    size = max(1, BLOCK_VALUES // max(x.size, 1))
+    sizes = [size] * (replicates // size)
+    if replicates % size:
+        sizes.append(replicates % size)
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+
+    if workers is None:
+        workers = os.cpu_count()
+    if workers == 1:
+        _share(x, y, counts)
+        results = [_replicate_block(kind, block_seed, block_size)
+                   for block_seed, block_size in zip(seeds, sizes)]
+    else:
+        with concurrent.futures.ProcessPoolExecutor(
+                workers, initializer=_share,
+                initargs=(x, y, counts)) as pool:
+            results = list(pool.map(_replicate_block, [kind] * len(sizes),
+                                    seeds, sizes))
+
+    mask = np.arange(x.shape[1]) < counts[:, None]
+    observed = _statistics(x, y, mask)
+    replicated = [np.concatenate([result[i] for result in results], axis=-1)
+                  for i in range(2)]
+
+    return {name: (values.reshape(shape), draws.reshape(shape + (-1,)))
+            for name, values, draws in zip(['r', 'slope'], observed,
+                                           replicated)}
+
+
+def bootstrap(x, y, replicates=10000, level=0.95, workers=None, seed=0):
+    """
+    Bootstrap the Pearson correlation and the least squares slope of y on
+    x for many series at once, resampling the (x, y) pairs where both are
+    valid.
+
+    Args:
+      - x (np.ndarray): Predictor values, series on the leading axes and
+        points on the last one
+      - y (np.ndarray): Response values, broadcastable with x
+      - replicates (int): Number of bootstrap replicates
+      - level (float): Level of the percentile intervals
+      - workers (int): Number of worker processes, defaults to the CPU
+        count; 1 runs in this process
+      - seed (int): Seed of the random streams
+
+    Returns:
+      - intervals (dict): Interval of 'r' and of 'slope'
+    """
+    tail = (1.0 - level) / 2.0 * 100.0
+    intervals = {}
+    for name, (observed, values) in _resample(
+            'bootstrap', x, y, replicates, workers, seed).items():
+        with warnings.catch_warnings():
+            # Series without a valid replicate get NaN
+            warnings.simplefilter('ignore', RuntimeWarning)
+            se = np.nanstd(values, axis=-1, ddof=1)
+            lower, upper = np.nanpercentile(values, [tail, 100.0 - tail],
+                                            axis=-1)
+        intervals[name] = Interval(observed, se, lower, upper, values)
+
+    return intervals
+
+
+def permutation_test(x, y, replicates=10000, workers=None, seed=0):
+    """
+    Test the Pearson correlation and the least squares slope of y on x for
+    many series at once against the null of no association, by shuffling
+    y among the points where both are valid. The two-sided p-value is
+    (1 + replicates at least as extreme) / (1 + replicates).
+
+    Args:
+      - x (np.ndarray): Predictor values, series on the leading axes and
+        points on the last one
+      - y (np.ndarray): Response values, broadcastable with x
+      - replicates (int): Number of permutations
+      - workers (int): Number of worker processes, defaults to the CPU
+        count; 1 runs in this process
+      - seed (int): Seed of the random streams
+
+    Returns:
+      - tests (dict): Test of 'r' and of 'slope'
+    """
+    tests = {}
+    for name, (observed, values) in _resample(
+            'permutation', x, y, replicates, workers, seed).items():
+        # Replicates equal to the observed value up to rounding count as
+        # at least as extreme
+        with np.errstate(invalid='ignore'):
+            extreme = (np.abs(values) >= np.abs(observed)[..., None] *
+                       (1.0 - 1e-12)).sum(axis=-1)
+        p_value = (1.0 + extreme) / (1.0 + values.shape[-1])
+        tests[name] = Test(observed,
+                           np.where(np.isnan(observed), np.nan, p_value),
+                           values)
+
+    return tests
@@ -0,0 +1,88 @@
+import concurrent.futures
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from cube import Cube, build_cube, correlate, correlation_frame, rolling_mean
+
+
+# Base cube opened read-only by each worker process
+_shared = {}
+
+
+def _open_shared(path, countries, indicators, years):
+    """
+    Worker initializer: memory-map the base cube written by run_countries,
+    so every worker reads the same page-cache copy instead of a pickle.
+    """
+    _shared['cube'] = Cube(np.load(path, mmap_mode='r'), countries,
+                           indicators, years)
+
+
+def _run_shard(positions, windows, window, method, min_periods):
+    """
+    Run the slice, moving average and correlation stages for the countries
+    at the given positions of the shared cube.
+    """
+    cube = _shared['cube']
+    countries = [cube.countries[p] for p in positions]
+    year_positions = {year: p for p, year in enumerate(cube.years)}
+
+    cubes = []
+    for years in windows.values():
+        columns = [year_positions[year] for year in years]
+        values = cube.values[positions][:, :, columns]
+        cubes.append(rolling_mean(Cube(values, countries, cube.indicators,
+                                       list(years)), window, min_periods))
+
+    return correlation_frame(correlate(cubes, method), cubes[0],
+                             list(windows))
+
+
+def run_countries(df, windows, window=5, method='pearson', workers=None,
+                  shards=None, min_periods=None):
+    """
+    Run the moving average and correlation pipeline for every country of a
+    frame on a process pool. The countries are split into shards, and the
+    base data is shared with the workers through a memory-mapped file.
+
+    Args:
+      - df (pd.DataFrame): Frame returned by read_worldbank_data
+      - windows (dict): Year columns of each period, by period name, e.g.
+        {'start': start_20_years_columns, 'recent': recent_20_years_columns}
+      - window (int): Number of years in the moving window
+      - method (str): 'pearson' or 'spearman'
+      - workers (int): Number of worker processes, defaults to the CPU count
+      - shards (int): Number of country shards, defaults to four per worker
+      - min_periods (int): Valid years needed for a moving average,
+        defaults to window
+
+    Returns:
+      - correlations (pd.Series): Correlations indexed by Country Code,
+        Window and the two Indicator Codes, for every country
+    """
+    cube = build_cube(df)
+    if workers is None:
+        workers = os.cpu_count()
+    if shards is None:
+        shards = workers * 4
+    country_shards = [positions for positions in
+                      np.array_split(np.arange(len(cube.countries)), shards)
+                      if len(positions)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'cube.npy')
+        np.save(path, cube.values)
+
+        with concurrent.futures.ProcessPoolExecutor(
+                workers, initializer=_open_shared,
+                initargs=(path, cube.countries, cube.indicators,
+                          cube.years)) as pool:
+            futures = [pool.submit(_run_shard, positions, windows, window,
+                                   method, min_periods)
+                       for positions in country_shards]
+            results = [future.result() for future in futures]
+
+    return pd.concat(results)
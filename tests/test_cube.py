@@ -0,0 +1,50 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from cube import build_cube, moving_average, year_window
+from finalstatsassignment import CO2, read_worldbank_files
+
+
+def _write_wdi(path, first_year, last_year, offset):
+    """
+    Write a one-row World Bank CSV whose value for every year is the year
+    plus offset, with the empty trailing column of the downloads.
+    """
+    years = [str(year) for year in range(first_year, last_year + 1)]
+    df = pd.DataFrame([['China', 'CHN', 'CO2 emissions (kt)', CO2] +
+                       [year + offset for year in range(first_year,
+                                                        last_year + 1)]],
+                      columns=['Country Name', 'Country Code',
+                               'Indicator Name', 'Indicator Code'] + years)
+    df['Unnamed: {}'.format(len(df.columns))] = np.nan
+    df.to_csv(path, index=False)
+
+    return str(path)
+
+
+def test_files_with_different_years_are_combined_in_year_order(tmp_path):
+    later = _write_wdi(tmp_path / 'b.csv', 1970, 2022, 0.0)
+    earlier = _write_wdi(tmp_path / 'a.csv', 1960, 2022, 0.5)
+
+    df, _ = read_worldbank_files([later, earlier], income={'CHN': 'X'},
+                                 fill_value=None)
+    cube = build_cube(df)
+
+    assert cube.years == [str(year) for year in range(1960, 2023)]
+    window = year_window(cube, 1965, 1975)
+    assert window.years == [str(year) for year in range(1965, 1976)]
+    # b.csv comes first, so its series is kept and 1960-1969 are missing
+    np.testing.assert_array_equal(
+        window.values[0, 0],
+        [np.nan] * 5 + [float(year) for year in range(1970, 1976)])
+    assert np.isnan(moving_average(cube.values, 5)[0, 0, :14]).all()
+
+
+def test_year_window_rejects_unordered_years():
+    cube = build_cube(pd.DataFrame(
+        [[1.0, 2.0, 3.0]], columns=['2021', '2022', '1960'],
+        index=pd.MultiIndex.from_tuples([('CHN', CO2)])))
+
+    with pytest.raises(ValueError):
+        year_window(cube, 2021, 2022)
@@ -0,0 +1,21 @@
+import numpy as np
+
+from intervals import bands, t_quantile, x_grid
+from regression import regress
+
+
+def test_bands_of_a_single_regression():
+    x = np.arange(10.0)
+    y = 2.0 * x + np.random.default_rng(0).normal(size=10)
+    fits = regress(x, y)
+
+    result = bands(fits, x_grid(x, points=5))
+
+    assert result.fitted.shape == (5,)
+    np.testing.assert_allclose(result.fitted,
+                               fits.intercept + fits.slope * result.x)
+    margin = t_quantile(0.95, 8) * np.sqrt(fits.mse * (
+        0.1 + (result.x - 4.5) ** 2 / fits.stats.sxx))
+    np.testing.assert_allclose(result.ci_upper - result.fitted, margin)
+    assert (result.pi_upper > result.ci_upper).all()
+    assert (result.pi_lower < result.ci_lower).all()
@@ -0,0 +1,153 @@
+import numpy as np
+import pandas as pd
+
+
+# Columns of the long table, in order
+LONG_COLUMNS = ['Country Code', 'Indicator Code', 'Year', 'Value']
+
+
+def to_long(df, dropna=True, value_dtype='float64'):
+    """
+    Melt a frame returned by read_worldbank_data into a long table with one
+    row per (country, indicator, year). The codes are categoricals with
+    sorted categories, Year is int16, and the rows are sorted by country,
+    indicator and year so every country and every series is a contiguous
+    range of rows. No transpose is involved.
+
+    Args:
+      - df (pd.DataFrame): Frame indexed by Country Code and Indicator Code
+      - dropna (bool): Leave out missing values instead of storing NaN rows
+      - value_dtype (str): Dtype of the Value column
+
+    Returns:
+      - long (pd.DataFrame): Table with the LONG_COLUMNS columns
+    """
+    df = df.sort_index()
+    years = df.select_dtypes('number').columns
+    values = df[years].to_numpy(dtype=value_dtype)
+
+    country = pd.Categorical(df.index.get_level_values(0).astype(str))
+    indicator = pd.Categorical(df.index.get_level_values(1).astype(str))
+    n_years = len(years)
+
+    long = pd.DataFrame({
+        'Country Code': pd.Categorical.from_codes(
+            np.repeat(country.codes, n_years), country.categories),
+        'Indicator Code': pd.Categorical.from_codes(
+            np.repeat(indicator.codes, n_years), indicator.categories),
+        'Year': np.tile(years.astype(int).to_numpy(dtype='int16'),
+                        len(df)),
+        'Value': values.ravel()
+    })
+    if dropna:
+        long = long[~np.isnan(long['Value'].to_numpy())]
+
+    return long.reset_index(drop=True)
+
+
+def select(long, countries=None, indicators=None, start=None, end=None):
+    """
+    Range-scan a long table. Each requested country is located with a
+    binary search on the sorted country codes, and only its rows are then
+    filtered by indicator and year.
+
+    Args:
+      - long (pd.DataFrame): Table built by to_long
+      - countries (list): Country codes, defaults to all of them
+      - indicators (list): Indicator codes, defaults to all of them
+      - start (int): First year, defaults to the first one
+      - end (int): Last year (inclusive), defaults to the last one
+
+    Returns:
+      - rows (pd.DataFrame): The matching rows, still sorted
+    """
+    if countries is not None:
+        column = long['Country Code'].cat
+        codes = column.codes.to_numpy()
+        wanted = np.sort(column.categories.get_indexer(countries))
+        wanted = wanted[wanted >= 0]
+        first = np.searchsorted(codes, wanted, side='left')
+        last = np.searchsorted(codes, wanted, side='right')
+        long = long.iloc[np.concatenate(
+            [np.arange(a, b) for a, b in zip(first, last)] +
+            [np.empty(0, dtype='int64')])]
+
+    mask = np.ones(len(long), dtype=bool)
+    if indicators is not None:
+        mask &= long['Indicator Code'].isin(indicators).to_numpy()
+    years = long['Year'].to_numpy()
+    if start is not None:
+        mask &= years >= start
+    if end is not None:
+        mask &= years <= end
+
+    return long[mask]
+
+
+def rolling_long(long, window=5, min_periods=None):
+    """
+    Compute moving averages over years directly on a long table. Windows
+    are defined on the Year values, so missing rows simply count as
+    missing years, matching cube.moving_average on the wide data. All
+    series are handled in one vectorised pass: a binary search finds the
+    first row of each window and cumulative sums give the window totals.
+
+    Args:
+      - long (pd.DataFrame): Table built by to_long or selected from one
+      - window (int): Number of years in the moving window
+      - min_periods (int): Valid years needed for an average, defaults to
+        window
+
+    Returns:
+      - averages (pd.DataFrame): The same rows with Value replaced by the
+        moving average
+    """
+    if min_periods is None:
+        min_periods = window
+    if long.empty:
+        # e.g. a select that matched nothing
+        return long.copy()
+
+    country = long['Country Code'].cat.codes.to_numpy().astype('int64')
+    indicator = long['Indicator Code'].cat.codes.to_numpy().astype('int64')
+    years = long['Year'].to_numpy().astype('int64')
+    values = long['Value'].to_numpy(dtype='float64')
+
+    # One sortable key per row: series first, then year
+    span = int(years.max() - years.min()) + window + 1
+    n_indicators = len(long['Indicator Code'].cat.categories)
+    series = country * n_indicators + indicator
+    keys = series * span + (years - years.min() + window)
+    starts = np.searchsorted(keys, keys - window + 1, side='left')
+
+    valid = ~np.isnan(values)
+    sums = np.concatenate([[0.0], np.cumsum(np.where(valid, values, 0.0))])
+    counts = np.concatenate([[0], np.cumsum(valid)])
+    rows = np.arange(1, len(values) + 1)
+    window_sums = sums[rows] - sums[starts]
+    window_counts = counts[rows] - counts[starts]
+
+    averages = long.copy()
+    with np.errstate(invalid='ignore', divide='ignore'):
+        averages['Value'] = np.where(window_counts >= max(min_periods, 1),
+                                     window_sums / window_counts, np.nan)
+
+    return averages
+
+
+def to_wide(long):
+    """
+    Turn a long table back into a frame with one column per year, indexed
+    by Country Code and Indicator Code like the frames get_series reads.
+
+    Args:
+      - long (pd.DataFrame): Table built by to_long or rolling_long
+
+    Returns:
+      - wide (pd.DataFrame): One row per series and one column per year
+    """
+    wide = long.set_index(['Country Code', 'Indicator Code', 'Year'])[
+        'Value'].unstack('Year')
+    wide.columns = wide.columns.astype(str)
+
+    return wide
@@ -0,0 +1,251 @@
+import numpy as np
+import pandas as pd
+
+from cube import build_cube
+
+
+# Power transforms supported by fit_lambdas
+METHODS = ('box-cox', 'yeo-johnson')
+
+# Best lambda of every series fitted so far, by method, search settings
+# and series fingerprint
+_lambdas = {}
+
+# Inverse of the golden ratio, the shrink factor of golden-section search
+_GOLDEN = (np.sqrt(5.0) - 1.0) / 2.0
+
+
+def _logs(values, method):
+    """
+    Precompute the logarithms shared by every lambda of a transform: log(y)
+    for Box-Cox and log(1 + |y|) for Yeo-Johnson, with the mask of valid
+    points. For Box-Cox a series with a non-positive value has no valid
+    point.
+    """
+    valid = ~np.isnan(values)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        if method == 'box-cox':
+            valid &= ~(values <= 0).any(axis=-1, keepdims=True)
+            logs = np.log(np.where(valid, values, 1.0))
+        else:
+            logs = np.log1p(np.abs(np.where(valid, values, 0.0)))
+
+    return logs, valid
+
+
+def _prepare(values, method):
+    """
+    Precompute everything the log-likelihood needs that does not depend on
+    lambda: the shared logs, the masks of negative and valid points and
+    the sum of the logs in the Jacobian.
+    """
+    logs, valid = _logs(values, method)
+    negative = values < 0
+    signs = np.where(negative, -1.0, 1.0) if method == 'yeo-johnson' else 1.0
+    log_jacobian = np.where(valid, signs * logs, 0.0).sum(axis=-1)
+
+    return logs, negative, valid, log_jacobian
+
+
+def _power(logs, negative, lambdas, method):
+    """
+    Apply a power transform from the precomputed logarithms, with one
+    lambda per series (broadcast over the last axis).
+    """
+    lambdas = np.asarray(lambdas, dtype='float64')[..., None]
+    with np.errstate(invalid='ignore', divide='ignore', over='ignore'):
+        transformed = np.where(lambdas == 0.0, logs,
+                               np.expm1(lambdas * logs) / lambdas)
+        if method == 'yeo-johnson':
+            flipped = 2.0 - lambdas
+            transformed = np.where(
+                negative, -np.where(flipped == 0.0, logs,
+                                    np.expm1(flipped * logs) / flipped),
+                transformed)
+
+    return transformed
+
+
+def _log_likelihood(logs, negative, valid, log_jacobian, lambdas, method):
+    """
+    Profile log-likelihood of every series at its lambda: -n/2 times the
+    log of the variance of the transformed values plus the log Jacobian,
+    (lambda - 1) times the sum of the shared logs.
+    """
+    n = valid.sum(axis=-1)
+    transformed = np.where(valid, _power(logs, negative, lambdas, method),
+                           0.0)
+    with np.errstate(invalid='ignore', divide='ignore', over='ignore'):
+        mean = transformed.sum(axis=-1) / n
+        variance = (np.where(valid, transformed - mean[..., None], 0.0) ** 2
+                    ).sum(axis=-1) / n
+
+        return -n / 2.0 * np.log(variance) + (lambdas - 1.0) * log_jacobian
+
+
+def profile_log_likelihood(values, lambdas, method='box-cox'):
+    """
+    Evaluate the profile log-likelihood of a grid of lambdas for many
+    series at once. The logarithms are computed once and shared by every
+    lambda. Missing values are left out.
+
+    Args:
+      - values (np.ndarray): Series on the leading axes, points on the last
+      - lambdas (np.ndarray): Grid of lambda values
+      - method (str): 'box-cox' or 'yeo-johnson'
+
+    Returns:
+      - llf (np.ndarray): Log-likelihoods of shape series x lambdas, NaN for
+        series with fewer than 2 points, constant series or, for Box-Cox,
+        series with a non-positive value
+    """
+    if method not in METHODS:
+        raise ValueError("method must be 'box-cox' or 'yeo-johnson'")
+
+    values = np.asarray(values, dtype='float64')
+    prepared = _prepare(values, method)
+    valid = prepared[2]
+    # A constant series has a zero variance at every lambda and no maximum
+    with np.errstate(invalid='ignore'):
+        usable = ((valid.sum(axis=-1) >= 2) &
+                  (np.where(valid, values, -np.inf).max(axis=-1) >
+                   np.where(valid, values, np.inf).min(axis=-1)))
+
+    llf = np.stack([_log_likelihood(*prepared,
+                                    np.full(values.shape[:-1], lam), method)
+                    for lam in np.asarray(lambdas, dtype='float64')],
+                   axis=-1)
+
+    return np.where(usable[..., None], llf, np.nan)
+
+
+def _fingerprints(values):
+    """
+    Hash every series, so a lambda can be reused while the series does not
+    change.
+    """
+    return pd.util.hash_pandas_object(pd.DataFrame(values),
+                                      index=False).to_numpy()
+
+
+def _refine(logs, negative, valid, log_jacobian, low, high, method,
+            tolerance):
+    """
+    Maximise the log-likelihood of every series between its bounds with a
+    golden-section search run on all series at once.
+    """
+    def llf(lambdas):
+        return _log_likelihood(logs, negative, valid, log_jacobian, lambdas,
+                               method)
+
+    a, b = low.copy(), high.copy()
+    c, d = b - _GOLDEN * (b - a), a + _GOLDEN * (b - a)
+    llf_c, llf_d = llf(c), llf(d)
+    while np.nanmax(b - a, initial=0.0) > tolerance:
+        left = ~(llf_c < llf_d)
+        b = np.where(left, d, b)
+        a = np.where(left, a, c)
+        c, d = (np.where(left, b - _GOLDEN * (b - a), d),
+                np.where(left, c, a + _GOLDEN * (b - a)))
+        llf_c, llf_d = (np.where(left, llf(c), llf_d),
+                        np.where(left, llf_c, llf(d)))
+
+    return (a + b) / 2.0
+
+
+def fit_lambdas(values, method='box-cox', bounds=(-2.0, 2.0), points=41,
+                tolerance=1e-6):
+    """
+    Find the maximum likelihood lambda of a power transform for many series
+    at once. The profile log-likelihood is evaluated on a grid of lambdas,
+    and the best grid lambda of every series is refined between its two
+    neighbours with a bounded golden-section search. Lambdas are memoised
+    by series fingerprint, so series already fitted with the same settings
+    are not fitted again.
+
+    Args:
+      - values (np.ndarray): Series on the leading axes, points on the last
+      - method (str): 'box-cox' or 'yeo-johnson'
+      - bounds (tuple): Lowest and highest lambda searched
+      - points (int): Number of grid lambdas
+      - tolerance (float): Width of the final bracket of the refinement
+
+    Returns:
+      - lambdas (np.ndarray): Best lambda of every series, NaN where the
+        transform cannot be fitted
+    """
+    values = np.asarray(values, dtype='float64')
+    shape = values.shape[:-1]
+    values = values.reshape(-1, values.shape[-1])
+    settings = (method, float(bounds[0]), float(bounds[1]), int(points),
+                float(tolerance))
+    keys = [settings + (fingerprint,)
+            for fingerprint in _fingerprints(values)]
+
+    lambdas = np.array([_lambdas.get(key, np.nan) for key in keys])
+    todo = np.array([key not in _lambdas for key in keys], dtype=bool)
+    if todo.any():
+        rows = values[todo]
+        grid = np.linspace(bounds[0], bounds[1], points)
+        llf = profile_log_likelihood(rows, grid, method)
+        # Lambdas whose transform overflows or has no spread are skipped
+        finite = np.isfinite(llf)
+        usable = finite.any(axis=-1)
+        best = np.argmax(np.where(finite, llf, -np.inf), axis=-1)
+
+        refined = _refine(*_prepare(rows, method),
+                          grid[np.maximum(best - 1, 0)],
+                          grid[np.minimum(best + 1, points - 1)], method,
+                          tolerance)
+        refined = np.where(usable, refined, np.nan)
+
+        lambdas[todo] = refined
+        for key, lam in zip((key for key, new in zip(keys, todo) if new),
+                            refined):
+            _lambdas[key] = float(lam)
+
+    return lambdas.reshape(shape)
+
+
+def power_transform(values, lambdas, method='box-cox'):
+    """
+    Transform many series, each with its own lambda.
+
+    Args:
+      - values (np.ndarray): Series on the leading axes, points on the last
+      - lambdas (np.ndarray): Lambda of every series, e.g. from fit_lambdas
+      - method (str): 'box-cox' or 'yeo-johnson'
+
+    Returns:
+      - transformed (np.ndarray): The transformed values, NaN where the
+        value is missing or cannot be transformed
+    """
+    values = np.asarray(values, dtype='float64')
+    logs, valid = _logs(values, method)
+
+    return np.where(valid, _power(logs, values < 0, lambdas, method),
+                    np.nan)
+
+
+def fit_lambdas_frame(df, indicators=None, method='box-cox', **kwargs):
+    """
+    Fit the lambda of every series of a frame returned by
+    read_worldbank_data, e.g. for CO2 emissions (kt) and Population, total.
+
+    Args:
+      - df (pd.DataFrame): Frame indexed by Country Code and Indicator Code
+      - indicators (list): Indicator codes, defaults to all of them
+      - method (str): 'box-cox' or 'yeo-johnson'
+      - kwargs: Search settings of fit_lambdas
+
+    Returns:
+      - lambdas (pd.Series): Lambda indexed by Country Code and Indicator
+        Code
+    """
+    cube = build_cube(df, indicators=indicators)
+    index = pd.MultiIndex.from_product([cube.countries, cube.indicators],
+                                       names=['Country Code',
+                                              'Indicator Code'])
+
+    return pd.Series(fit_lambdas(cube.values, method, **kwargs).ravel(),
+                     index=index, name='Lambda')